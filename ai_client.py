@@ -0,0 +1,162 @@
+# ai_client.py - GROK AI 异步客户端模块
+import asyncio
+import logging
+import os
+import time
+import aiohttp
+from dotenv import load_dotenv
+import codec
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+XAI_API_BASE = os.environ.get("XAI_API_BASE", "https://api.x.ai/v1")
+AI_MODEL = os.environ.get("AI_MODEL", "grok-3-mini-beta")
+AI_CONCURRENCY = int(os.environ.get("AI_CONCURRENCY", "8"))  # 同时进行的AI请求上限
+AI_DEADLINE = float(os.environ.get("AI_DEADLINE", "10"))  # 单次调用的总时限（含排队，秒）
+AI_POOL_SIZE = 16  # 连接池上限
+
+
+class GrokClient:
+    """
+    GROK AI 异步客户端
+    长期持有一个带连接池的会话，用信号量限制并发请求数，每次调用有总时限，
+    并记录调用次数、失败次数和延迟。
+    """
+
+    def __init__(self, api_key, base_url=XAI_API_BASE, model=AI_MODEL, system_prompt=None,
+                 concurrency=AI_CONCURRENCY, deadline=AI_DEADLINE, pool_size=AI_POOL_SIZE):
+        """
+        :param api_key: xAI API密钥
+        :param base_url: API地址，测试时可指向本地桩服务
+        :param model: 模型名称
+        :param system_prompt: 系统提示词
+        :param concurrency: 同时进行的请求上限
+        :param deadline: 单次调用的总时限（秒），包括等待信号量的时间
+        :param pool_size: 连接池上限
+        """
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.system_prompt = system_prompt
+        self.concurrency = concurrency
+        self.deadline = deadline
+        self.pool_size = pool_size
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._session = None
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.in_flight = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    async def start(self):
+        """创建会话（在事件循环中调用）"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60),
+            )
+
+    async def close(self):
+        """关闭会话"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def complete(self, prompt, temperature=0.5):
+        """
+        发送一次对话请求
+        :param prompt: 用户提示词
+        :param temperature: 采样温度
+        :return: 回复文本，失败或超时返回None
+        """
+        self.calls += 1
+        started = time.monotonic()
+        try:
+            return await asyncio.wait_for(self._complete(prompt, temperature), self.deadline)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            self.errors += 1
+            logger.error(f"GROK AI 请求超过 {self.deadline}s 时限")
+            return None
+        except (aiohttp.ClientError, KeyError, IndexError, ValueError) as e:
+            self.errors += 1
+            logger.error(f"调用GROK AI时出错: {e!r}")
+            return None
+        finally:
+            elapsed = time.monotonic() - started
+            self.latency_total += elapsed
+            self.latency_max = max(self.latency_max, elapsed)
+
+    async def _complete(self, prompt, temperature):
+        messages = []
+        if self.system_prompt:
+            messages.append({"role": "system", "content": self.system_prompt})
+        messages.append({"role": "user", "content": prompt})
+        payload = {
+            "messages": messages,
+            "model": self.model,
+            "stream": False,
+            "temperature": temperature,
+        }
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}",
+        }
+
+        async with self._semaphore:
+            await self.start()
+            self.in_flight += 1
+            try:
+                async with self._session.post(
+                    f"{self.base_url}/chat/completions", headers=headers, json=payload
+                ) as response:
+                    if response.status != 200:
+                        raise aiohttp.ClientResponseError(
+                            response.request_info, response.history,
+                            status=response.status, message=await response.text(),
+                        )
+                    data = codec.loads(await response.read())
+                    return data["choices"][0]["message"]["content"]
+            finally:
+                self.in_flight -= 1
+
+    def stats(self):
+        """返回调用统计"""
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "in_flight": self.in_flight,
+            "avg_latency": round(self.latency_total / self.calls, 3) if self.calls else 0.0,
+            "max_latency": round(self.latency_max, 3),
+        }
+
+
+if __name__ == "__main__":
+    # 使用本地桩服务测试并发限制和时限
+    from aiohttp import web
+
+    async def _stub_completion(request):
+        await asyncio.sleep(0.2)
+        return web.json_response({"choices": [{"message": {"content": "快哉快哉"}}]})
+
+    async def _demo():
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", _stub_completion)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 8765)
+        await site.start()
+
+        client = GrokClient("test", base_url="http://127.0.0.1:8765/v1", concurrency=4, deadline=2)
+        started = time.monotonic()
+        replies = await asyncio.gather(*(client.complete(f"测试{i}") for i in range(20)))
+        print(f"{len(replies)} 个请求耗时 {time.monotonic() - started:.2f}s，"
+              f"失败 {sum(r is None for r in replies)} 个")
+        print("统计:", client.stats())
+        await client.close()
+        await runner.cleanup()
+
+    asyncio.run(_demo())
@@ -0,0 +1,176 @@
+# broadcast.py - 定时推送工具模块
+import asyncio
+import logging
+import os
+import time
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+BROADCAST_WORKERS = int(os.environ.get("BROADCAST_WORKERS", "32"))  # 并发发送的工作协程数
+BROADCAST_QUEUE_SIZE = int(os.environ.get("BROADCAST_QUEUE_SIZE", "256"))  # 队列上限，满时生产者等待
+BROADCAST_PROGRESS_INTERVAL = 10  # 推送进行中记录进度的间隔（秒）
+
+# 单个推送任务的结果
+SENT = "sent"
+FAILED = "failed"
+DEACTIVATED = "deactivated"
+SKIPPED = "skipped"
+
+
+def group_users_by_city(user_ids, users):
+    """
+    按城市分组用户
+    :param user_ids: 需要推送的用户ID
+    :param users: {user_id: 用户数据}
+    :return: {city_id: [user_id, ...]}
+    """
+    groups = defaultdict(list)
+    for user_id in user_ids:
+        data = users.get(user_id)
+        if data and data.get("city_id"):
+            groups[data["city_id"]].append(user_id)
+    return dict(groups)
+
+
+class BroadcastTimings:
+    """记录一次推送中每个城市的查询耗时和每个用户的发送耗时"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.city_fetch = {}  # city_id -> 秒
+        self.user_send = []  # 每次发送的秒数
+
+    def record_city(self, city_id, seconds):
+        self.city_fetch[city_id] = seconds
+
+    def record_send(self, seconds):
+        self.user_send.append(seconds)
+
+    def summary(self):
+        """返回耗时汇总"""
+        fetch = list(self.city_fetch.values())
+        sends = sorted(self.user_send)
+        slowest_city = max(self.city_fetch, key=self.city_fetch.get) if fetch else None
+        return {
+            "elapsed": round(time.perf_counter() - self.started, 3),
+            "cities": len(fetch),
+            "fetch_avg": round(sum(fetch) / len(fetch), 3) if fetch else 0.0,
+            "fetch_max": round(max(fetch), 3) if fetch else 0.0,
+            "slowest_city": slowest_city,
+            "sends": len(sends),
+            "send_avg": round(sum(sends) / len(sends), 3) if sends else 0.0,
+            "send_p95": round(sends[min(len(sends) - 1, int(len(sends) * 0.95))], 3) if sends else 0.0,
+            "send_max": round(sends[-1], 3) if sends else 0.0,
+        }
+
+
+class BroadcastProgress:
+    """推送进度计数"""
+
+    def __init__(self):
+        self.queued = 0
+        self.sent = 0
+        self.failed = 0
+        self.deactivated = 0
+        self.skipped = 0
+
+    def record(self, status):
+        if status == SENT:
+            self.sent += 1
+        elif status == DEACTIVATED:
+            self.deactivated += 1
+        elif status == SKIPPED:
+            self.skipped += 1
+        else:
+            self.failed += 1
+
+    @property
+    def done(self):
+        return self.sent + self.failed + self.deactivated + self.skipped
+
+    def snapshot(self):
+        return {
+            "queued": self.queued,
+            "sent": self.sent,
+            "failed": self.failed,
+            "deactivated": self.deactivated,
+            "skipped": self.skipped,
+            "pending": self.queued - self.done,
+        }
+
+
+class BroadcastEngine:
+    """
+    生产者/消费者推送引擎
+    任务逐个放入有界队列，由固定数量的工作协程处理；队列满时生产者等待，
+    因此内存占用与队列上限有关，而与推送总量无关。可通过 cancel() 中止。
+    """
+
+    def __init__(self, handler, workers=BROADCAST_WORKERS, queue_size=BROADCAST_QUEUE_SIZE,
+                 progress_interval=BROADCAST_PROGRESS_INTERVAL, name="broadcast"):
+        """
+        :param handler: 处理单个任务的协程函数，返回 SENT/FAILED/DEACTIVATED/SKIPPED
+        :param workers: 工作协程数
+        :param queue_size: 队列上限
+        :param progress_interval: 记录进度日志的间隔（秒）
+        :param name: 日志中显示的名称
+        """
+        self.handler = handler
+        self.workers = workers
+        self.queue_size = queue_size
+        self.progress_interval = progress_interval
+        self.name = name
+        self.progress = BroadcastProgress()
+        self._run_task = None
+
+    @property
+    def running(self):
+        return self._run_task is not None and not self._run_task.done()
+
+    async def run(self, items):
+        """
+        处理所有任务，全部完成（或被取消）后返回
+        :param items: 任务的可迭代对象，按需逐个读取
+        :return: 进度快照
+        """
+        self._run_task = asyncio.current_task()
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        workers = [asyncio.create_task(self._worker(queue)) for _ in range(self.workers)]
+        reporter = asyncio.create_task(self._report())
+        try:
+            for item in items:
+                await queue.put(item)
+                self.progress.queued += 1
+            await queue.join()
+        except asyncio.CancelledError:
+            logger.warning(f"{self.name} 已取消: {self.progress.snapshot()}")
+            raise
+        finally:
+            reporter.cancel()
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(reporter, *workers, return_exceptions=True)
+            self._run_task = None
+        return self.progress.snapshot()
+
+    def cancel(self):
+        """中止正在进行的推送"""
+        if self.running:
+            self._run_task.cancel()
+
+    async def _worker(self, queue):
+        while True:
+            item = await queue.get()
+            try:
+                self.progress.record(await self.handler(item))
+            except Exception as e:
+                self.progress.record(FAILED)
+                logger.error(f"{self.name} 任务 {item!r} 失败: {e}", exc_info=True)
+            finally:
+                queue.task_done()
+
+    async def _report(self):
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            logger.info(f"{self.name} 进行中: {self.progress.snapshot()}")
@@ -0,0 +1,122 @@
+# cache.py - 带容量上限的TTL/LRU缓存模块
+import time
+from collections import OrderedDict
+
+# 查询结果的新鲜度标签
+FRESH = "fresh"  # 缓存命中且未过期
+STALE = "stale"  # 已过期但在宽限期内，先返回旧值再刷新
+MISS = "miss"  # 未命中，需要等待查询
+
+
+class TTLCache:
+    """
+    容量有限的LRU缓存，条目在读取时检查是否过期（不为每个条目创建定时任务）
+    超出容量时淘汰最久未使用的条目，并统计命中、未命中、淘汰和过期次数。
+    设置 grace 后，过期条目在宽限期内仍保留，可通过 get_entry() 作为旧值读取。
+    """
+
+    def __init__(self, maxsize=1024, ttl=300, clock=time.monotonic, grace=0):
+        """
+        :param maxsize: 最大条目数
+        :param ttl: 默认有效期（秒）
+        :param clock: 时钟函数，便于替换
+        :param grace: 过期后继续保留旧值的时长（秒），0表示过期即删除
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.grace = grace
+        self._clock = clock
+        self._data = OrderedDict()  # key -> (过期时间, 值)
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        """
+        读取缓存，过期条目会被删除并视为未命中
+        :return: 缓存值或 default
+        """
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return default
+        expires_at, value = item
+        now = self._clock()
+        if expires_at <= now:
+            if expires_at + self.grace <= now:
+                del self._data[key]
+                self.expirations += 1
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def get_entry(self, key):
+        """
+        读取缓存，宽限期内的过期条目作为旧值返回
+        :return: (值, 是否已过期)，未命中或超过宽限期时返回None
+        """
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+        expires_at, value = item
+        now = self._clock()
+        if expires_at + self.grace <= now:
+            del self._data[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        if expires_at <= now:
+            self.stale_hits += 1
+            return value, True
+        self.hits += 1
+        return value, False
+
+    def set(self, key, value, ttl=None):
+        """
+        写入缓存
+        :param ttl: 本条目的有效期（秒），默认使用缓存的 ttl
+        """
+        self._data[key] = (self._clock() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key, default=None):
+        item = self._data.pop(key, None)
+        return default if item is None else item[1]
+
+    def clear(self):
+        self._data.clear()
+
+    def purge(self):
+        """删除所有已过期（且超过宽限期）的条目，返回删除数量"""
+        now = self._clock()
+        expired = [key for key, (expires_at, _) in self._data.items() if expires_at + self.grace <= now]
+        for key in expired:
+            del self._data[key]
+        self.expirations += len(expired)
+        return len(expired)
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """返回缓存统计"""
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
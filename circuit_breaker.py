@@ -0,0 +1,199 @@
+# circuit_breaker.py - 熔断与重试模块
+import logging
+import os
+import random
+import threading
+import time
+from dotenv import load_dotenv
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get("BREAKER_FAILURE_THRESHOLD", "5"))  # 连续失败多少次后熔断
+BREAKER_RESET_TIMEOUT = float(os.environ.get("BREAKER_RESET_TIMEOUT", "30"))  # 熔断后多久允许试探请求（秒）
+BREAKER_HALF_OPEN_MAX = int(os.environ.get("BREAKER_HALF_OPEN_MAX", "1"))  # 半开状态下同时放行的试探请求数
+RETRY_ATTEMPTS = int(os.environ.get("QWEATHER_RETRIES", "1"))  # 失败后的重试次数（不含首次请求）
+RETRY_BASE_DELAY = float(os.environ.get("QWEATHER_RETRY_BASE_DELAY", "0.3"))  # 首次重试的最大等待（秒）
+RETRY_MAX_DELAY = float(os.environ.get("QWEATHER_RETRY_MAX_DELAY", "3"))  # 重试等待上限（秒）
+
+# 熔断器状态
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """熔断器打开时拒绝请求"""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"{name} 已熔断，{retry_after:.0f}s 后重试")
+        self.name = name
+        self.retry_after = retry_after
+
+
+def backoff_delay(attempt, base=RETRY_BASE_DELAY, cap=RETRY_MAX_DELAY):
+    """
+    指数退避加全抖动：在 [0, min(cap, base * 2^attempt)] 内均匀取值，避免大量请求同时重试
+    :param attempt: 第几次重试（从0开始）
+    :return: 等待秒数
+    """
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    """
+    单个接口的熔断器
+    关闭状态下正常放行，连续失败达到阈值后打开并直接拒绝请求；
+    打开 reset_timeout 秒后进入半开状态，放行少量试探请求，成功则关闭，失败则重新打开。
+    同一进程内的多个客户端（包括后台事件循环线程中的同步客户端）共享状态，因此内部加锁。
+    """
+
+    def __init__(self, name, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT,
+                 half_open_max=BREAKER_HALF_OPEN_MAX, clock=time.monotonic):
+        """
+        :param name: 名称（接口路径），用于日志
+        :param failure_threshold: 连续失败多少次后熔断
+        :param reset_timeout: 熔断后多久进入半开状态（秒）
+        :param half_open_max: 半开状态下同时放行的试探请求数
+        :param clock: 时钟函数，便于替换
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max = half_open_max
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0  # 连续失败次数
+        self._opened_at = 0.0
+        self._probes = 0  # 半开状态下进行中的试探请求
+        self.successes = 0
+        self.total_failures = 0
+        self.rejected = 0
+        self.opened = 0
+
+    def _update_state(self):
+        if self._state == OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._probes = 0
+
+    def _open(self):
+        self._state = OPEN
+        self._opened_at = self._clock()
+        self.opened += 1
+        logger.warning(f"⚡ {self.name} 连续失败 {self._failures} 次，熔断 {self.reset_timeout:.0f}s")
+
+    @property
+    def state(self):
+        with self._lock:
+            self._update_state()
+            return self._state
+
+    def retry_after(self):
+        """距离允许试探请求的秒数，未熔断时为0"""
+        with self._lock:
+            if self._state != OPEN:
+                return 0.0
+            return max(0.0, self.reset_timeout - (self._clock() - self._opened_at))
+
+    def allow(self):
+        """
+        是否放行一次请求（半开状态下放行即占用一个试探名额，需随后调用 record_success/record_failure）
+        :return: bool
+        """
+        with self._lock:
+            self._update_state()
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and self._probes < self.half_open_max:
+                self._probes += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def check(self):
+        """放行请求，熔断中则抛出 CircuitOpenError"""
+        if not self.allow():
+            raise CircuitOpenError(self.name, self.retry_after())
+
+    def record_success(self):
+        """记录请求成功"""
+        with self._lock:
+            self.successes += 1
+            self._failures = 0
+            if self._state != CLOSED:
+                logger.info(f"✅ {self.name} 已恢复，关闭熔断")
+            self._state = CLOSED
+            self._probes = 0
+
+    def record_failure(self):
+        """记录请求失败"""
+        with self._lock:
+            self.total_failures += 1
+            self._failures += 1
+            if self._state == HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+                self._open()
+            elif self._state == CLOSED and self._failures >= self.failure_threshold:
+                self._open()
+
+    def release(self):
+        """放行的请求没有结果（例如被取消）时调用，归还半开状态的试探名额"""
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+
+    def stats(self):
+        """返回熔断器状态和计数"""
+        with self._lock:
+            self._update_state()
+            return {
+                "state": self._state,
+                "consecutive_failures": self._failures,
+                "successes": self.successes,
+                "failures": self.total_failures,
+                "rejected": self.rejected,
+                "opened": self.opened,
+            }
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name):
+    """
+    获取进程内共享的熔断器（按名称创建）
+    :param name: 接口名称，例如 "/v7/weather/now"
+    :return: CircuitBreaker
+    """
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name)
+        return breaker
+
+
+def breaker_stats():
+    """
+    返回所有共享熔断器的状态
+    :return: {名称: 状态字典}
+    """
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.stats() for breaker in breakers}
+
+
+if __name__ == "__main__":
+    # 用模拟时钟演示状态变化
+    clock = [0.0]
+    breaker = CircuitBreaker("demo", failure_threshold=3, reset_timeout=10, clock=lambda: clock[0])
+    for _ in range(3):
+        breaker.allow()
+        breaker.record_failure()
+    print("连续失败3次:", breaker.state, "允许请求:", breaker.allow())
+    clock[0] += 10
+    print("10秒后:", breaker.state, "试探请求:", breaker.allow(), "第二个请求:", breaker.allow())
+    breaker.record_success()
+    print("试探成功:", breaker.stats())
+    print("退避等待:", [round(backoff_delay(attempt), 2) for attempt in range(5)])
@@ -0,0 +1,332 @@
+# city_index.py - 离线城市索引模块
+"""
+基于和风天气 LocationList（China-City-List-latest.csv）构建的离线城市索引。
+
+索引文件为紧凑的二进制格式，加载时通过 mmap 映射，不需要解析整个文件：
+    头部        魔数、版本号、各段的数量与偏移
+    字符串段    去重后的 UTF-8 字符串，每个字符串前有2字节长度
+    记录段      每个城市10个uint32（字符串偏移及排序权重）
+    中文键段    按字节序排序的 (名称偏移, 记录号) 数组
+    拼音键段    按字节序排序的 (拼音偏移, 记录号) 数组
+查询时在键数组上二分查找，支持精确、前缀和拼音（含一次编辑距离的模糊）匹配。
+
+构建索引：
+    python city_index.py build China-City-List-latest.csv
+"""
+import argparse
+import csv
+import logging
+import mmap
+import os
+import struct
+import threading
+import unicodedata
+from dotenv import load_dotenv
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+CITY_INDEX_FILE = os.environ.get("CITY_INDEX_FILE", "city_index.bin")
+
+MAGIC = b"QWCI"
+VERSION = 1
+HEADER = struct.Struct("<4sIIIIIIII")  # 魔数, 版本, 记录数, 中文键数, 拼音键数, 4个段偏移
+RECORD = struct.Struct("<10I")
+KEY = struct.Struct("<II")
+STR_LEN = struct.Struct("<H")
+
+# 记录字段顺序（最后一个字段为排序权重，不是字符串偏移）
+FIELDS = ("id", "name", "pinyin", "adm1", "adm2", "country", "tz", "lat", "lon")
+RANK = len(FIELDS)
+
+# 中文名常见后缀，精确查询不到时去掉后缀重试（北京市 -> 北京）
+ZH_SUFFIXES = ("市", "区", "县", "省", "自治州", "自治县", "特别行政区")
+PREFIX_SCAN_LIMIT = 200  # 前缀匹配最多扫描的键数量
+
+
+def normalize_pinyin(text):
+    """拼音键规范化：小写并去掉空格、撇号和连字符"""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return "".join(ch for ch in text if ch.isalnum())
+
+
+def _city_rank(name, adm1, adm2):
+    # 直辖市/省会等与上级同名的城市排在前面，其次是地级市，最后是区县
+    if adm1 in (name, f"{name}市"):
+        return 0
+    if name == adm2:
+        return 1
+    return 2
+
+
+def build_index(csv_path, output_path=CITY_INDEX_FILE):
+    """
+    从 LocationList CSV 构建二进制索引文件
+    :param csv_path: China-City-List-latest.csv 路径
+    :param output_path: 输出索引文件路径
+    :return: 写入的城市数量
+    """
+    rows = []
+    with open(csv_path, "r", encoding="utf-8-sig", newline="") as f:
+        reader = csv.reader(f)
+        header = None
+        for row in reader:
+            # 文件开头可能有版本说明行，跳到表头为止
+            if header is None:
+                if row and row[0].strip() == "Location_ID":
+                    header = {name.strip(): i for i, name in enumerate(row)}
+                continue
+            if len(row) < len(header):
+                continue
+            rows.append({
+                "id": row[header["Location_ID"]].strip(),
+                "name": row[header["Location_Name_ZH"]].strip(),
+                "pinyin": normalize_pinyin(row[header["Location_Name_EN"]]),
+                "adm1": row[header["Adm1_Name_ZH"]].strip(),
+                "adm2": row[header["Adm2_Name_ZH"]].strip(),
+                "country": row[header["Country_Region_ZH"]].strip(),
+                "tz": row[header["Timezone"]].strip(),
+                "lat": row[header["Latitude"]].strip(),
+                "lon": row[header["Longitude"]].strip(),
+            })
+    if header is None:
+        raise ValueError(f"{csv_path} 中找不到 Location_ID 表头")
+
+    strings = bytearray()
+    string_offsets = {}
+
+    def intern(value):
+        if value not in string_offsets:
+            encoded = value.encode("utf-8")
+            string_offsets[value] = len(strings)
+            strings.extend(STR_LEN.pack(len(encoded)))
+            strings.extend(encoded)
+        return string_offsets[value]
+
+    records = bytearray()
+    zh_keys = []
+    py_keys = []
+    for idx, row in enumerate(rows):
+        offsets = [intern(row[field]) for field in FIELDS]
+        offsets.append(_city_rank(row["name"], row["adm1"], row["adm2"]))
+        records.extend(RECORD.pack(*offsets))
+        zh_keys.append((row["name"].encode("utf-8"), offsets[1], idx))
+        if row["pinyin"]:
+            py_keys.append((row["pinyin"].encode("utf-8"), offsets[2], idx))
+
+    def pack_keys(keys):
+        keys.sort()
+        return b"".join(KEY.pack(offset, idx) for _, offset, idx in keys)
+
+    zh_blob = pack_keys(zh_keys)
+    py_blob = pack_keys(py_keys)
+
+    strings_offset = HEADER.size
+    records_offset = strings_offset + len(strings)
+    zh_offset = records_offset + len(records)
+    py_offset = zh_offset + len(zh_blob)
+
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(
+            MAGIC, VERSION, len(rows), len(zh_keys), len(py_keys),
+            strings_offset, records_offset, zh_offset, py_offset,
+        ))
+        f.write(strings)
+        f.write(records)
+        f.write(zh_blob)
+        f.write(py_blob)
+    os.replace(tmp_path, output_path)
+    return len(rows)
+
+
+class CityIndex:
+    """
+    内存映射的离线城市索引
+    返回的城市字典字段与城市搜索API一致（id、name、adm1、adm2、country、lat、lon、tz）。
+    """
+
+    def __init__(self, path=CITY_INDEX_FILE):
+        """
+        :param path: 索引文件路径
+        :raises ValueError: 文件格式不正确
+        """
+        self.path = path
+        with open(path, "rb") as f:
+            self._buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.size, self._zh_count, self._py_count,
+         self._strings, self._records, self._zh, self._py) = HEADER.unpack_from(self._buf, 0)
+        if magic != MAGIC or version != VERSION:
+            self._buf.close()
+            raise ValueError(f"{path} 不是有效的城市索引文件")
+
+    def close(self):
+        self._buf.close()
+
+    def _string_bytes(self, offset):
+        pos = self._strings + offset
+        (length,) = STR_LEN.unpack_from(self._buf, pos)
+        return self._buf[pos + STR_LEN.size:pos + STR_LEN.size + length]
+
+    def _key(self, base, i):
+        return KEY.unpack_from(self._buf, base + i * KEY.size)
+
+    def _lower_bound(self, base, count, target):
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._string_bytes(self._key(base, mid)[0]) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _record(self, idx):
+        values = RECORD.unpack_from(self._buf, self._records + idx * RECORD.size)
+        city = {field: self._string_bytes(values[i]).decode("utf-8") for i, field in enumerate(FIELDS)}
+        city["rank"] = values[RANK]
+        city["type"] = "city"
+        return city
+
+    def _scan(self, base, count, query):
+        """返回 [(是否精确匹配, 记录号)]，包含所有精确匹配及前缀匹配"""
+        target = query.encode("utf-8")
+        matches = []
+        i = self._lower_bound(base, count, target)
+        while i < count and len(matches) < PREFIX_SCAN_LIMIT:
+            offset, idx = self._key(base, i)
+            key = self._string_bytes(offset)
+            if not key.startswith(target):
+                break
+            matches.append((key == target, idx))
+            i += 1
+        return matches
+
+    def _fuzzy_pinyin(self, query):
+        """与查询拼音编辑距离为1的键（首字母相同），用于拼写错误"""
+        target = query.encode("utf-8")
+        first = target[:1]
+        i = self._lower_bound(self._py, self._py_count, first)
+        matches = []
+        while i < self._py_count:
+            offset, idx = self._key(self._py, i)
+            key = self._string_bytes(offset)
+            if not key.startswith(first):
+                break
+            if abs(len(key) - len(target)) <= 1 and _within_one_edit(key, target):
+                matches.append((False, idx))
+            i += 1
+        return matches
+
+    def search(self, keyword, adm=None, number=5, pinyin_exact=False):
+        """
+        查询城市
+        :param keyword: 中文名或拼音
+        :param adm: 上级行政区划过滤（匹配adm1或adm2）
+        :param number: 返回结果数量
+        :param pinyin_exact: 拼音查询只返回精确匹配（不做前缀和模糊匹配）
+        :return: 城市列表，无匹配时返回空列表
+        """
+        query = unicodedata.normalize("NFKC", keyword).strip()
+        if not query:
+            return []
+        if query.isascii():
+            query = normalize_pinyin(query)
+            matches = self._scan(self._py, self._py_count, query)
+            if pinyin_exact:
+                matches = [match for match in matches if match[0]]
+            elif not matches and len(query) >= 3:
+                matches = self._fuzzy_pinyin(query)
+        else:
+            matches = self._scan(self._zh, self._zh_count, query)
+            if not any(exact for exact, _ in matches):
+                for suffix in ZH_SUFFIXES:
+                    if query.endswith(suffix) and len(query) > len(suffix):
+                        matches = self._scan(self._zh, self._zh_count, query[:-len(suffix)]) or matches
+                        break
+
+        cities = []
+        seen = set()
+        for exact, idx in matches:
+            if idx in seen:
+                continue
+            seen.add(idx)
+            city = self._record(idx)
+            if adm and adm not in (city["adm1"], city["adm2"]):
+                continue
+            cities.append((not exact, city["rank"], len(city["name"]), city))
+        cities.sort(key=lambda item: item[:3])
+        return [city for *_, city in cities[:number]]
+
+
+def _within_one_edit(a, b):
+    if a == b:
+        return True
+    if len(a) == len(b):
+        return sum(x != y for x, y in zip(a, b)) == 1
+    if len(a) < len(b):
+        a, b = b, a
+    # a 比 b 多一个字符
+    for i in range(len(b) + 1):
+        if a[:i] + a[i + 1:] == b:
+            return True
+    return False
+
+
+_default_index = None
+_default_loaded = False
+_default_lock = threading.Lock()
+
+
+def get_city_index():
+    """获取进程内共享的城市索引，索引文件不存在或无效时返回None"""
+    global _default_index, _default_loaded
+    with _default_lock:
+        if not _default_loaded:
+            _default_loaded = True
+            if os.path.exists(CITY_INDEX_FILE):
+                try:
+                    _default_index = CityIndex(CITY_INDEX_FILE)
+                    logger.info(f"已加载离线城市索引：{_default_index.size} 个城市")
+                except (OSError, ValueError, struct.error) as e:
+                    logger.error(f"加载离线城市索引 {CITY_INDEX_FILE} 失败: {e}")
+        return _default_index
+
+
+def lookup(keyword, adm=None, number=5, lang="zh"):
+    """
+    在离线索引中查询城市（索引仅包含中文数据）
+    英文输入只采用精确的拼音匹配：前缀或模糊匹配可能是国外城市的误判（如 "Bali" 匹配到巴林右旗），
+    这类查询交给城市搜索API处理。
+    :return: 城市列表，索引不可用或无匹配时返回None
+    """
+    if lang != "zh":
+        return None
+    index = get_city_index()
+    if index is None:
+        return None
+    return index.search(keyword, adm, number, pinyin_exact=True) or None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="和风天气离线城市索引工具")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="从 LocationList CSV 构建索引")
+    build_parser.add_argument("csv", help="China-City-List-latest.csv 路径")
+    build_parser.add_argument("-o", "--output", default=CITY_INDEX_FILE, help="索引文件路径")
+    search_parser = subparsers.add_parser("search", help="在索引中查询城市")
+    search_parser.add_argument("keyword", help="城市名称或拼音")
+    search_parser.add_argument("-i", "--index", default=CITY_INDEX_FILE, help="索引文件路径")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        count = build_index(args.csv, args.output)
+        print(f"✅ 已写入 {count} 个城市到 {args.output}")
+    else:
+        index = CityIndex(args.index)
+        for city in index.search(args.keyword):
+            print(f"{city['id']}  {city['name']} ({city['adm1']}/{city['adm2']})  {city['lat']},{city['lon']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# codec.py - JSON编解码模块
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:  # orjson 为可选依赖，未安装时使用标准库
+    orjson = None
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+# 解码失败时抛出的异常（orjson.JSONDecodeError 是它的子类）
+JSONDecodeError = json.JSONDecodeError
+
+
+def loads(data):
+    """
+    解析JSON
+    :param data: bytes 或 str（响应体可直接传入 bytes，无需先解码）
+    :return: 解析后的对象
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj, indent=False):
+    """
+    序列化为JSON字符串，非ASCII字符原样保留
+    :param obj: 可JSON序列化的对象
+    :param indent: 是否缩进2格（便于阅读的文件），否则输出紧凑格式
+    :return: str
+    """
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, option=option).decode("utf-8")
+    if indent:
+        return json.dumps(obj, ensure_ascii=False, indent=2)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+if __name__ == "__main__":
+    # 解码耗时对比：标准库 json 与当前后端，以及gzip压缩后的传输大小
+    import gzip
+    import timeit
+
+    SAMPLE = json.dumps({
+        "code": "200",
+        "updateTime": "2024-06-01T10:32+08:00",
+        "fxLink": "https://www.qweather.com/weather/beijing-101010100.html",
+        "now": {
+            "obsTime": "2024-06-01T10:24+08:00", "temp": "26", "feelsLike": "27", "icon": "101",
+            "text": "多云", "wind360": "180", "windDir": "南风", "windScale": "3", "windSpeed": "15",
+            "humidity": "48", "precip": "0.0", "pressure": "1003", "vis": "16", "cloud": "91", "dew": "14",
+        },
+        "refer": {"sources": ["QWeather"], "license": ["QWeather Developers License"]},
+    }, ensure_ascii=False).encode("utf-8")
+    COUNT = 50000
+
+    print(f"当前后端: {BACKEND}")
+    print(f"响应大小: {len(SAMPLE)} 字节，gzip后 {len(gzip.compress(SAMPLE))} 字节")
+    stdlib = timeit.timeit(lambda: json.loads(SAMPLE), number=COUNT) / COUNT * 1e6
+    print(f"json.loads:   {stdlib:6.2f} 微秒/次")
+    if orjson is not None:
+        fast = timeit.timeit(lambda: orjson.loads(SAMPLE), number=COUNT) / COUNT * 1e6
+        print(f"orjson.loads: {fast:6.2f} 微秒/次 ({stdlib / fast:.1f}x)")
@@ -13,6 +13,7 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from geo_api import search_city
 from weather_api import get_weather
 from jwt_token import generate_qweather_token
+from models import fmt_number
 
 # 配置信息
 API_HOST = os.environ.get("API_HOST")
@@ -41,12 +42,12 @@ def get_city_weather(city_name, token):
 
     # 使用第一个匹配的城市
     city = cities[0]
-    city_id = city["id"]
+    city_id = city.id
     
     # 获取天气数据
     weather_data = get_weather(token, city_id, API_HOST)
     if not weather_data:
-        print(f"⚠️ 无法获取{city['name']}的天气数据")
+        print(f"⚠️ 无法获取{city.name}的天气数据")
         return city, None
     
     return city, weather_data
@@ -62,41 +63,41 @@ def format_weather_message(city_info, weather_data):
     if not city_info or not weather_data:
         return "<p>获取天气信息失败</p>"
 
-    now = weather_data["now"]
-    admin_info = f"{city_info['adm1']}/{city_info['adm2']}" if city_info['adm1'] != city_info['adm2'] else city_info['adm1']
+    now = weather_data
+    admin_info = city_info.admin_info
     
     # 创建HTML内容
     html = f"""
     <html>
     <body>
-        <h2>🌈 今日天气: {city_info['name']} ({admin_info})</h2>
+        <h2>🌈 今日天气: {city_info.name} ({admin_info})</h2>
         <table style="border-collapse: collapse; width: 100%;">
             <tr>
                 <td style="padding: 8px; border: 1px solid #ddd;"><strong>🕒 观测时间</strong></td>
-                <td style="padding: 8px; border: 1px solid #ddd;">{now['obsTime']}</td>
+                <td style="padding: 8px; border: 1px solid #ddd;">{now.obs_time}</td>
             </tr>
             <tr>
                 <td style="padding: 8px; border: 1px solid #ddd;"><strong>🌡 温度</strong></td>
-                <td style="padding: 8px; border: 1px solid #ddd;">{now['temp']}℃ (体感 {now['feelsLike']}℃)</td>
+                <td style="padding: 8px; border: 1px solid #ddd;">{fmt_number(now.temp)}℃ (体感 {fmt_number(now.feels_like)}℃)</td>
             </tr>
             <tr>
                 <td style="padding: 8px; border: 1px solid #ddd;"><strong>☁️ 天气状况</strong></td>
-                <td style="padding: 8px; border: 1px solid #ddd;">{now['text']} (代码: {now['icon']})</td>
+                <td style="padding: 8px; border: 1px solid #ddd;">{now.text} (代码: {now.icon})</td>
             </tr>
             <tr>
                 <td style="padding: 8px; border: 1px solid #ddd;"><strong>🌪 风向风力</strong></td>
-                <td style="padding: 8px; border: 1px solid #ddd;">{now['windDir']} {now['windScale']}级</td>
+                <td style="padding: 8px; border: 1px solid #ddd;">{now.wind_dir} {now.wind_scale}级</td>
             </tr>
             <tr>
                 <td style="padding: 8px; border: 1px solid #ddd;"><strong>💧 湿度</strong></td>
-                <td style="padding: 8px; border: 1px solid #ddd;">{now['humidity']}%</td>
+                <td style="padding: 8px; border: 1px solid #ddd;">{fmt_number(now.humidity)}%</td>
             </tr>
             <tr>
                 <td style="padding: 8px; border: 1px solid #ddd;"><strong>👁 能见度</strong></td>
-                <td style="padding: 8px; border: 1px solid #ddd;">{now['vis']}公里</td>
+                <td style="padding: 8px; border: 1px solid #ddd;">{fmt_number(now.vis)}公里</td>
             </tr>
         </table>
-        <p><small>📡 数据来源: {' | '.join(weather_data['refer']['sources'])}</small></p>
+        <p><small>📡 数据来源: {' | '.join(now.sources)}</small></p>
         <p><small>⏱️ 邮件生成时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</small></p>
     </body>
     </html>
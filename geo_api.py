@@ -1,7 +1,7 @@
 # geo_api.py - 城市搜索功能模块
-import requests
 import os
 from dotenv import load_dotenv
+import qweather_client
 load_dotenv()
 
 def search_city(token, keyword, api_host=os.environ.get("API_HOST"), adm=None, number=5):
@@ -12,52 +12,26 @@ def search_city(token, keyword, api_host=os.environ.get("API_HOST"), adm=None, n
     :param api_host: API主机地址
     :param adm: 上级行政区划过滤
     :param number: 返回结果数量
-    :return: 城市列表或None
+    :return: City列表或None
     """
-    params = {
-        "location": keyword,
-        "adm": adm,
-        "number": number,
-        "lang": "zh"
-    }
-
-    headers = {"Authorization": f"Bearer {token}"}
-
-    try:
-        response = requests.get(
-            f"{api_host}/geo/v2/city/lookup",
-            headers=headers,
-            params=params,
-            timeout=5
-        )
-        response.raise_for_status()
-        data = response.json()
-
-        if data["code"] == "200" and data.get("location"):
-            return data["location"]
-        print(f"⚠️ 城市搜索失败：{data.get('code', '未知错误')}")
-        return None
-
-    except requests.exceptions.RequestException as e:
-        print(f"🔌 请求异常：{e}")
-        return None
+    # 离线城市索引和搜索缓存由客户端查询，未命中时才请求API
+    return qweather_client.run_sync("search_city", token, keyword, api_host, adm, number)
 
 
 def display_city_info(cities):
     """
     显示城市信息列表
-    :param cities: 城市数据列表
+    :param cities: City列表
     """
     print("\n🔍 找到以下城市：")
     for idx, city in enumerate(cities, 1):
-        admin_info = f"{city['adm1']}/{city['adm2']}" if city['adm1'] != city['adm2'] else city['adm1']
-        print(f"{idx}. {city['name']} ({admin_info}), {city['country']}")
+        print(f"{idx}. {city.name} ({city.admin_info}), {city.country}")
 
 
 def select_city(cities):
     """
     用户选择城市
-    :param cities: 城市数据列表
+    :param cities: City列表
     :return: 选择的城市ID或None
     """
     while True:
@@ -68,7 +42,7 @@ def select_city(cities):
 
             choice = int(choice)
             if 1 <= choice <= len(cities):
-                return cities[choice - 1]["id"]
+                return cities[choice - 1].id
             print("输入超出范围，请重新选择")
 
         except ValueError:
@@ -78,12 +52,12 @@ def select_city(cities):
 def get_selected_city_data(cities, location_id):
     """
     获取选中城市的完整数据
-    :param cities: 城市数据列表
+    :param cities: City列表
     :param location_id: 选中的城市ID
-    :return: 完整城市数据字典
+    :return: City或None
     """
     for city in cities:
-        if city["id"] == location_id:
+        if city.id == location_id:
             return city
     return None
 
@@ -91,7 +65,7 @@ def get_selected_city_data(cities, location_id):
 def select_multiple_cities(cities):
     """
     用户选择多个城市
-    :param cities: 城市数据列表
+    :param cities: City列表
     :return: 选择的城市ID列表
     """
     selected_ids = []
@@ -105,7 +79,7 @@ def select_multiple_cities(cities):
             return [] if not selected_ids else selected_ids
         
         if choice == 'a':
-            return [city["id"] for city in cities]
+            return [city.id for city in cities]
         
         try:
             # 处理逗号分隔的多个选择
@@ -114,7 +88,7 @@ def select_multiple_cities(cities):
             
             for sel in selections:
                 if 1 <= sel <= len(cities):
-                    city_id = cities[sel - 1]["id"]
+                    city_id = cities[sel - 1].id
                     if city_id not in selected_ids:
                         selected_ids.append(city_id)
                         valid_selections.append(sel)
@@ -122,7 +96,7 @@ def select_multiple_cities(cities):
                     print(f"忽略无效选择: {sel}")
             
             if valid_selections:
-                city_names = ", ".join([cities[i-1]["name"] for i in valid_selections])
+                city_names = ", ".join([cities[i-1].name for i in valid_selections])
                 print(f"已选择: {city_names}")
                 
                 add_more = input("是否继续添加更多城市? (y/n): ").strip().lower()
@@ -149,4 +123,4 @@ if __name__ == "__main__":
         # 测试获取完整城市数据
         if city_id:
             city_data = get_selected_city_data(result, city_id)
-            print(f"城市经纬度: {city_data.get('lat')}, {city_data.get('lon')}")
\ No newline at end of file
+            print(f"城市经纬度: {city_data.lat}, {city_data.lon}")
\ No newline at end of file
@@ -0,0 +1,129 @@
+# geo_cache.py - 城市搜索结果持久化缓存模块
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from dotenv import load_dotenv
+import codec
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+GEO_CACHE_FILE = os.environ.get("GEO_CACHE_FILE", "geo_cache.db")
+GEO_CACHE_TTL = 30 * 24 * 3600  # 命中结果缓存30天
+GEO_CACHE_NEGATIVE_TTL = 24 * 3600  # 未找到城市的结果缓存1天
+
+# get() 未命中时的返回值，用于区分"未缓存"和"缓存了未找到"
+MISS = object()
+
+
+class GeoCache:
+    """
+    城市搜索结果缓存（SQLite持久化，重启后仍然有效）
+    以规范化后的关键词、adm、number、lang为键，未找到城市的结果也会被缓存。
+    """
+
+    def __init__(self, path=GEO_CACHE_FILE, ttl=GEO_CACHE_TTL, negative_ttl=GEO_CACHE_NEGATIVE_TTL):
+        """
+        :param path: SQLite数据库文件路径
+        :param ttl: 命中结果的有效期（秒）
+        :param negative_ttl: 未找到结果的有效期（秒）
+        """
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS geo_cache ("
+            "key TEXT PRIMARY KEY, result TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.execute("DELETE FROM geo_cache WHERE expires_at < ?", (time.time(),))
+
+    @staticmethod
+    def make_key(keyword, adm=None, number=5, lang="zh"):
+        """
+        生成缓存键：关键词和adm做全半角、大小写及空白规范化
+        :return: 缓存键字符串
+        """
+        def normalize(value):
+            value = unicodedata.normalize("NFKC", str(value or "")).casefold()
+            return " ".join(value.split())
+
+        return "|".join([normalize(keyword), normalize(adm), str(number), lang or ""])
+
+    def get(self, keyword, adm=None, number=5, lang="zh"):
+        """
+        查询缓存
+        :return: 城市列表（未找到城市时为空列表），未命中或已过期时返回 MISS
+        """
+        key = self.make_key(keyword, adm, number, lang)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result, expires_at FROM geo_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or row[1] < time.time():
+                self.misses += 1
+                return MISS
+            cities = codec.loads(row[0])
+            if cities:
+                self.hits += 1
+            else:
+                self.negative_hits += 1
+            return cities
+
+    def put(self, keyword, cities, adm=None, number=5, lang="zh"):
+        """
+        写入缓存
+        :param cities: 城市列表，为空表示未找到城市
+        """
+        key = self.make_key(keyword, adm, number, lang)
+        ttl = self.ttl if cities else self.negative_ttl
+        result = codec.dumps(cities or [])
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO geo_cache (key, result, expires_at) VALUES (?, ?, ?)",
+                (key, result, time.time() + ttl),
+            )
+
+    def stats(self):
+        """返回命中统计"""
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM geo_cache").fetchone()[0]
+        lookups = self.hits + self.negative_hits + self.misses
+        return {
+            "size": size,
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.negative_hits) / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_default_cache = None
+_default_failed = False
+_default_lock = threading.Lock()
+
+
+def get_geo_cache():
+    """获取进程内共享的 GeoCache，打开失败时返回None（不使用缓存）"""
+    global _default_cache, _default_failed
+    with _default_lock:
+        if _default_cache is None and not _default_failed:
+            try:
+                _default_cache = GeoCache()
+            except sqlite3.Error as e:
+                logger.error(f"打开城市搜索缓存 {GEO_CACHE_FILE} 失败: {e}")
+                _default_failed = True
+        return _default_cache
@@ -1,49 +1,167 @@
 # jwt_token.py
+import asyncio
+import logging
+import threading
 import time
 import jwt
 import os
+from cryptography.hazmat.primitives.serialization import load_pem_private_key
 from dotenv import load_dotenv
 load_dotenv()
 
-def generate_qweather_token(private_key_path="ed25519-private.pem"):
+logger = logging.getLogger(__name__)
+
+DEFAULT_PRIVATE_KEY_PATH = "ed25519-private.pem"
+TOKEN_TTL = 300  # Token有效期（秒）
+REFRESH_MARGIN = 60  # 距离过期多久时刷新（秒）
+RETRY_DELAY = 10  # 后台刷新失败后的重试间隔（秒）
+
+
+class TokenError(Exception):
+    """Token生成失败（私钥缺失、私钥无效或签名出错）"""
+
+
+class TokenProvider:
     """
-    自动生成和风天气JWT Token
-    :param private_key_path: EdDSA私钥文件路径
-    :return: 有效期为5分钟的JWT Token
+    和风天气JWT Token提供器
+    私钥只读取和解析一次，Token在过期前被复用，并由后台定时器提前刷新。
+    get_token() 可同时被多个线程调用，协程中使用 get_token_async()。
     """
-    try:
-        # 读取私钥文件
-        with open(private_key_path, "r") as pem_file:
-            private_key = pem_file.read().strip()
 
-        # 生成Payload
+    def __init__(self, private_key_path=DEFAULT_PRIVATE_KEY_PATH, ttl=TOKEN_TTL, refresh_margin=REFRESH_MARGIN):
+        """
+        :param private_key_path: EdDSA私钥文件路径
+        :param ttl: Token有效期（秒）
+        :param refresh_margin: 距离过期多久时刷新（秒）
+        """
+        self.private_key_path = private_key_path
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self._lock = threading.Lock()
+        self._private_key = None
+        self._token = None
+        self._refresh_at = 0.0
+        self._timer = None
+        self._closed = False
+
+    def _load_private_key(self):
+        if self._private_key is None:
+            try:
+                with open(self.private_key_path, "rb") as pem_file:
+                    self._private_key = load_pem_private_key(pem_file.read().strip(), password=None)
+            except FileNotFoundError:
+                raise TokenError(f"私钥文件 {self.private_key_path} 未找到") from None
+            except (ValueError, TypeError) as e:
+                raise TokenError(f"私钥文件 {self.private_key_path} 无效: {e}") from e
+        return self._private_key
+
+    def _sign(self):
+        now = int(time.time())
         payload = {
-            'iat': int(time.time()) - 30,  # 补偿时间差
-            'exp': int(time.time()) + 300,  # 5分钟有效期
+            'iat': now - 30,  # 补偿时间差
+            'exp': now + self.ttl,
             'sub': os.environ.get("SUB")  # 你的账户ID
         }
-
-        # 请求头信息
         headers = {
             'kid': os.environ.get("KID")  # 你的Key ID
         }
+        try:
+            return jwt.encode(payload, self._load_private_key(), algorithm='EdDSA', headers=headers)
+        except jwt.PyJWTError as e:
+            raise TokenError(f"JWT生成失败: {e}") from e
+
+    def _fresh_token(self):
+        token = self._token
+        if token and time.time() < self._refresh_at:
+            return token
+        return None
+
+    def _refresh_locked(self):
+        self._token = self._sign()
+        self._refresh_at = time.time() + self.ttl - self.refresh_margin
+        self._schedule(self.ttl - self.refresh_margin)
+
+    def _schedule(self, delay):
+        if self._closed:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(delay, self._background_refresh)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _background_refresh(self):
+        with self._lock:
+            if self._closed:
+                return
+            try:
+                self._refresh_locked()
+            except TokenError as e:
+                logger.error(f"后台刷新Token失败，{RETRY_DELAY}s 后重试: {e}")
+                self._schedule(RETRY_DELAY)
 
-        # 生成Token
-        return jwt.encode(
-            payload,
-            private_key,
-            algorithm='EdDSA',
-            headers=headers
-        )
+    def get_token(self):
+        """
+        获取有效的Token
+        :return: JWT Token
+        :raises TokenError: 私钥缺失或签名失败
+        """
+        token = self._fresh_token()
+        if token:
+            return token
+        with self._lock:
+            token = self._fresh_token()
+            if token:
+                return token
+            self._refresh_locked()
+            return self._token
 
-    except FileNotFoundError:
-        print(f"❌ 私钥文件 {private_key_path} 未找到")
-        exit(1)
-    except jwt.PyJWTError as e:
-        print(f"❌ JWT生成失败: {str(e)}")
-        exit(1)
+    async def get_token_async(self):
+        """协程版本的 get_token()，需要签名时在线程中执行以免阻塞事件循环"""
+        token = self._fresh_token()
+        if token:
+            return token
+        return await asyncio.to_thread(self.get_token)
+
+    def close(self):
+        """停止后台刷新"""
+        with self._lock:
+            self._closed = True
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+
+_providers = {}
+_providers_lock = threading.Lock()
+
+
+def get_token_provider(private_key_path=DEFAULT_PRIVATE_KEY_PATH):
+    """
+    获取指定私钥对应的共享 TokenProvider
+    :param private_key_path: EdDSA私钥文件路径
+    :return: TokenProvider
+    """
+    with _providers_lock:
+        provider = _providers.get(private_key_path)
+        if provider is None:
+            provider = _providers[private_key_path] = TokenProvider(private_key_path)
+        return provider
+
+
+def generate_qweather_token(private_key_path=DEFAULT_PRIVATE_KEY_PATH):
+    """
+    获取和风天气JWT Token（由共享的 TokenProvider 缓存并自动刷新）
+    :param private_key_path: EdDSA私钥文件路径
+    :return: 有效期为5分钟的JWT Token
+    :raises TokenError: 私钥缺失或签名失败
+    """
+    return get_token_provider(private_key_path).get_token()
 
 
 if __name__ == "__main__":
     # 单独测试Token生成
-    print("生成的Token:", generate_qweather_token())
\ No newline at end of file
+    try:
+        print("生成的Token:", generate_qweather_token())
+    except TokenError as e:
+        print(f"❌ {e}")
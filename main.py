@@ -1,14 +1,17 @@
 # main.py
 from dotenv import load_dotenv
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from geo_api import search_city, display_city_info, select_city, get_selected_city_data, select_multiple_cities
-from weather_api import get_weather, display_weather, display_multiple_weather, get_weather_warning, display_weather_warning, display_multiple_weather_warnings
+from weather_api import get_weather, get_weather_many, display_weather, display_multiple_weather, get_weather_warning_many, display_weather_warning, display_multiple_weather_warnings
 from jwt_token import generate_qweather_token
 import map_visualization
 
 load_dotenv()
 
 API_HOST = os.environ.get("API_HOST")
+CLI_MAX_WORKERS = int(os.environ.get("CLI_MAX_WORKERS", "8"))  # 多城市查询的最大并发数
 
 
 def main():
@@ -44,6 +47,53 @@ def main():
             print("❌ 无效选择，请重新输入")
 
 
+def run_parallel(func, items, label):
+    """
+    并发执行 func(item)，显示实时进度和该阶段耗时
+    :param func: 对单个元素执行的函数
+    :param items: 元素列表
+    :param label: 进度行前缀
+    :return: 结果列表，顺序与 items 一致；出错的元素结果为None
+    """
+    if not items:
+        return []
+    results = [None] * len(items)
+    started = time.perf_counter()
+    done = 0
+    with ThreadPoolExecutor(max_workers=min(CLI_MAX_WORKERS, len(items))) as pool:
+        futures = {pool.submit(func, item): i for i, item in enumerate(items)}
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                results[index] = future.result()
+            except Exception as e:
+                print(f"\n❌ {items[index]} 处理出错: {e}")
+            done += 1
+            print(f"\r{label}: {done}/{len(items)}", end="", flush=True)
+    print(f"\r{label}: {done}/{len(items)} 完成，耗时 {time.perf_counter() - started:.2f}s")
+    return results
+
+
+def fetch_batch(fetch_many, token, cities, label):
+    """
+    批量查询一组城市，显示实时进度和该阶段耗时
+    :param fetch_many: get_weather_many 或 get_weather_warning_many
+    :param cities: 城市信息列表
+    :param label: 进度行前缀
+    :return: 结果列表，顺序与 cities 一致；失败的城市结果为None
+    """
+    if not cities:
+        return []
+    location_ids = [city.id for city in cities]
+
+    def progress(done, total):
+        print(f"\r{label}: {done}/{total}", end="", flush=True)
+
+    batch = fetch_many(token, location_ids, progress=progress)
+    print(f"\r{label}: {len(batch.successes)}/{len(batch)} 成功，耗时 {batch.elapsed:.2f}s")
+    return batch.ordered(location_ids)
+
+
 def single_city_query(token):
     """单城市天气查询"""
     # 用户输入
@@ -83,7 +133,7 @@ def single_city_query(token):
             except Exception as e:
                 print(f"生成地图时出错: {e}")
                 # 提供静态地图URL作为回退选项
-                lat, lon = city_data.get("lat", 0), city_data.get("lon", 0)
+                lat, lon = city_data.lat or 0, city_data.lon or 0
                 static_map_url = map_visualization.get_static_map_url(lat, lon)
                 print(f"您可以通过访问以下链接查看静态地图:\n{static_map_url}")
 
@@ -103,11 +153,11 @@ def warning_query(token):
     selected_cities = []
     warning_data_list = []
 
-    # 处理每个输入的城市名称
-    for i, city_name in enumerate(city_names):
-        print(f"\n🔍 正在搜索城市: {city_name} ({i+1}/{len(city_names)})")
-        cities = search_city(token, city_name, API_HOST)
-        
+    # 并发搜索所有城市
+    search_results = run_parallel(lambda name: search_city(token, name, API_HOST), city_names, "🔍 搜索城市")
+
+    # 处理每个输入的城市名称（多个匹配时需要用户选择）
+    for city_name, cities in zip(city_names, search_results):
         if not cities:
             print(f"❌ 未找到城市: {city_name}")
             continue
@@ -115,9 +165,10 @@ def warning_query(token):
         # 如果只找到一个城市，直接选择
         if len(cities) == 1:
             city_data = cities[0]
-            print(f"✅ 自动选择唯一匹配城市: {city_data['name']} ({city_data['adm1']})")
+            print(f"✅ 自动选择唯一匹配城市: {city_data.name} ({city_data.adm1})")
         else:
             # 找到多个城市，让用户选择
+            print(f"\n🔍 {city_name} 有多个匹配城市:")
             display_city_info(cities)
             location_id = select_city(cities)
             if not location_id:
@@ -126,17 +177,21 @@ def warning_query(token):
 
         if city_data:
             selected_cities.append(city_data)
-            # 获取天气预警数据
-            print(f"📜 正在获取 {city_data['name']} 的天气灾害预警...")
-            warning_data = get_weather_warning(token, city_data["id"])
-            if warning_data:
-                warning_data_list.append(warning_data)
-            else:
-                print(f"❌ 获取 {city_data['name']} 的天气灾害预警失败")
+
+    # 并发获取天气预警数据
+    warning_results = fetch_batch(get_weather_warning_many, token, selected_cities, "📜 获取天气灾害预警")
+    found_cities = []
+    for city_data, warning_data in zip(selected_cities, warning_results):
+        if warning_data:
+            found_cities.append(city_data)
+            warning_data_list.append(warning_data)
+        else:
+            print(f"❌ 获取 {city_data.name} 的天气灾害预警失败")
+    selected_cities = found_cities
 
     # 根据查询的城市数量，选择不同的显示方式
     if not selected_cities:
-        print("❌ 未选择任何城市，无法查询预警")
+        print("❌ 没有可显示的天气灾害预警")
         return
 
     if len(selected_cities) == 1:
@@ -170,27 +225,25 @@ def multiple_cities_query(token):
     
     # 自动选择模式
     if query_mode == "1":
-        for i, city_name in enumerate(city_names):
-            print(f"\n🔍 正在搜索城市: {city_name} ({i+1}/{len(city_names)})")
-            cities = search_city(token, city_name, API_HOST)
-            
+        # 并发搜索所有城市，自动选择第一个城市（通常是匹配度最高的）
+        search_results = run_parallel(lambda name: search_city(token, name, API_HOST), city_names, "🔍 搜索城市")
+        matched_cities = []
+        for city_name, cities in zip(city_names, search_results):
             if not cities:
                 print(f"❌ 未找到城市: {city_name}")
                 continue
-            
-            # 自动选择第一个城市（通常是匹配度最高的）
             city_data = cities[0]
-            selected_cities.append(city_data)
-            
-            print(f"✅ 自动选择: {city_data['name']} ({city_data['adm1']})")
-            
-            # 获取天气数据
-            print(f"🌤️ 正在获取 {city_data['name']} 的天气数据...")
-            weather_data = get_weather(token, city_data["id"], API_HOST)
+            matched_cities.append(city_data)
+            print(f"✅ 自动选择: {city_data.name} ({city_data.adm1})")
+
+        # 并发获取天气数据，结果保持输入顺序
+        weather_results = fetch_batch(get_weather_many, token, matched_cities, "🌤️ 获取天气数据")
+        for city_data, weather_data in zip(matched_cities, weather_results):
             if weather_data:
+                selected_cities.append(city_data)
                 weather_data_list.append(weather_data)
             else:
-                print(f"❌ 获取 {city_data['name']} 的天气数据失败")
+                print(f"❌ 获取 {city_data.name} 的天气数据失败")
     
     # 手动选择模式
     elif query_mode == "2":
@@ -206,16 +259,16 @@ def multiple_cities_query(token):
             # 如果只找到一个城市，直接选择
             if len(cities) == 1:
                 city_data = cities[0]
-                print(f"✅ 自动选择唯一匹配城市: {city_data['name']} ({city_data['adm1']})")
+                print(f"✅ 自动选择唯一匹配城市: {city_data.name} ({city_data.adm1})")
                 selected_cities.append(city_data)
                 
                 # 获取天气数据
-                print(f"🌤️ 正在获取 {city_data['name']} 的天气数据...")
-                weather_data = get_weather(token, city_data["id"], API_HOST)
+                print(f"🌤️ 正在获取 {city_data.name} 的天气数据...")
+                weather_data = get_weather(token, city_data.id, API_HOST)
                 if weather_data:
                     weather_data_list.append(weather_data)
                 else:
-                    print(f"❌ 获取 {city_data['name']} 的天气数据失败")
+                    print(f"❌ 获取 {city_data.name} 的天气数据失败")
             else:
                 # 找到多个城市，显示选项
                 display_city_info(cities)
@@ -233,27 +286,26 @@ def multiple_cities_query(token):
                     selected_cities.append(city_data)
                     
                     # 获取天气数据
-                    print(f"🌤️ 正在获取 {city_data['name']} 的天气数据...")
+                    print(f"🌤️ 正在获取 {city_data.name} 的天气数据...")
                     weather_data = get_weather(token, location_id, API_HOST)
                     if weather_data:
                         weather_data_list.append(weather_data)
                     else:
-                        print(f"❌ 获取 {city_data['name']} 的天气数据失败")
+                        print(f"❌ 获取 {city_data.name} 的天气数据失败")
                 elif choice_mode == "2":
                     # 批量选择
                     location_ids = select_multiple_cities(cities)
-                    for loc_id in location_ids:
-                        city_data = get_selected_city_data(cities, loc_id)
-                        if city_data:
+                    chosen_cities = [get_selected_city_data(cities, loc_id) for loc_id in location_ids]
+                    chosen_cities = [city_data for city_data in chosen_cities if city_data]
+                    
+                    # 批量获取天气数据
+                    weather_results = fetch_batch(get_weather_many, token, chosen_cities, "🌤️ 获取天气数据")
+                    for city_data, weather_data in zip(chosen_cities, weather_results):
+                        if weather_data:
                             selected_cities.append(city_data)
-                            
-                            # 获取天气数据
-                            print(f"🌤️ 正在获取 {city_data['name']} 的天气数据...")
-                            weather_data = get_weather(token, loc_id, API_HOST)
-                            if weather_data:
-                                weather_data_list.append(weather_data)
-                            else:
-                                print(f"❌ 获取 {city_data['name']} 的天气数据失败")
+                            weather_data_list.append(weather_data)
+                        else:
+                            print(f"❌ 获取 {city_data.name} 的天气数据失败")
                 else:
                     print("❌ 无效选择，跳过当前城市")
     else:
@@ -6,6 +6,7 @@ from io import BytesIO
 import base64
 import tempfile
 import importlib
+from models import fmt_number
 
 # 检查plugins模块是否可用
 HAS_PLUGINS = False
@@ -21,30 +22,30 @@ def create_weather_map(location_data, weather_data):
     """
     创建天气地图可视化
     
-    :param location_data: 位置数据字典，包含lat和lon字段
-    :param weather_data: 天气数据字典
+    :param location_data: City
+    :param weather_data: WeatherNow
     :return: HTML文件路径
     """
     # 从位置数据中提取经纬度
-    lat = float(location_data.get("lat", 0))
-    lon = float(location_data.get("lon", 0))
+    lat = location_data.lat or 0
+    lon = location_data.lon or 0
     
     # 创建地图，以位置为中心
     weather_map = folium.Map(location=[lat, lon], zoom_start=10)
     
     # 获取天气信息
-    now = weather_data.get("now", {})
-    weather_text = now.get("text", "未知")
-    temp = now.get("temp", "N/A")
+    now = weather_data
+    weather_text = now.text or "未知"
+    temp = fmt_number(now.temp)
     
     # 构建弹出信息
     popup_text = f"""
         <div style="font-family: Arial; width: 160px;">
-            <h4 style="margin-bottom: 5px;">{location_data.get('name', '未知位置')}</h4>
+            <h4 style="margin-bottom: 5px;">{location_data.name or '未知位置'}</h4>
             <p style="margin: 2px 0;">🌡️ 温度: {temp}°C</p>
             <p style="margin: 2px 0;">☁️ 天气: {weather_text}</p>
-            <p style="margin: 2px 0;">💨 风向: {now.get('windDir', 'N/A')} {now.get('windScale', 'N/A')}级</p>
-            <p style="margin: 2px 0;">💧 湿度: {now.get('humidity', 'N/A')}%</p>
+            <p style="margin: 2px 0;">💨 风向: {now.wind_dir or 'N/A'} {now.wind_scale or 'N/A'}级</p>
+            <p style="margin: 2px 0;">💧 湿度: {fmt_number(now.humidity)}%</p>
         </div>
     """
     
@@ -52,7 +53,7 @@ def create_weather_map(location_data, weather_data):
     folium.Marker(
         location=[lat, lon],
         popup=folium.Popup(popup_text, max_width=200),
-        tooltip=f"{location_data.get('name', '位置')} - {weather_text}, {temp}°C",
+        tooltip=f"{location_data.name or '位置'} - {weather_text}, {temp}°C",
         icon=folium.Icon(icon="cloud", prefix="fa"),
     ).add_to(weather_map)
     
@@ -66,13 +67,13 @@ def create_temperature_heatmap(city_list, weather_data_list):
     """
     创建温度热力图
     
-    :param city_list: 城市列表，包含多个城市的位置数据
-    :param weather_data_list: 对应城市的天气数据列表
+    :param city_list: City列表
+    :param weather_data_list: 对应城市的 WeatherNow 列表
     :return: HTML文件路径
     """
     # 查找中心位置（使用第一个城市或默认值）
-    center_lat = float(city_list[0].get("lat", 35)) if city_list else 35
-    center_lon = float(city_list[0].get("lon", 105)) if city_list else 105
+    center_lat = city_list[0].lat if city_list and city_list[0].lat is not None else 35
+    center_lon = city_list[0].lon if city_list and city_list[0].lon is not None else 105
     
     # 创建地图
     heat_map = folium.Map(location=[center_lat, center_lon], zoom_start=5)
@@ -81,9 +82,7 @@ def create_temperature_heatmap(city_list, weather_data_list):
     temps = []
     for i, city in enumerate(city_list):
         if i < len(weather_data_list):
-            weather = weather_data_list[i].get("now", {})
-            temp = float(weather.get("temp", 0))
-            temps.append(temp)
+            temps.append(weather_data_list[i].temp or 0)
     
     min_temp = min(temps) if temps else 0
     max_temp = max(temps) if temps else 0
@@ -91,22 +90,23 @@ def create_temperature_heatmap(city_list, weather_data_list):
     # 准备数据和标记
     for i, city in enumerate(city_list):
         if i < len(weather_data_list):
-            weather = weather_data_list[i].get("now", {})
-            lat = float(city.get("lat", 0))
-            lon = float(city.get("lon", 0))
-            temp = float(weather.get("temp", 0))
+            weather = weather_data_list[i]
+            lat = city.lat or 0
+            lon = city.lon or 0
+            temp = weather.temp or 0
+            temp_label = fmt_number(temp)
             
             # 获取更多天气数据
-            weather_text = weather.get("text", "未知")
-            humidity = weather.get("humidity", "未知")
-            wind = f"{weather.get('windDir', '')} {weather.get('windScale', '')}级"
+            weather_text = weather.text or "未知"
+            humidity = fmt_number(weather.humidity, "未知")
+            wind = f"{weather.wind_dir} {weather.wind_scale}级"
             
             # 构建详细的弹出信息
             popup_html = f"""
             <div style="width: 200px;">
-                <h4 style="margin: 0 0 5px 0;">{city.get('name', '未知')} ({city.get('adm1', '')})</h4>
+                <h4 style="margin: 0 0 5px 0;">{city.name or '未知'} ({city.adm1})</h4>
                 <hr style="margin: 0 0 5px 0;">
-                <p style="margin: 3px 0;"><b>🌡️ 温度:</b> {temp}°C</p>
+                <p style="margin: 3px 0;"><b>🌡️ 温度:</b> {temp_label}°C</p>
                 <p style="margin: 3px 0;"><b>☁️ 天气:</b> {weather_text}</p>
                 <p style="margin: 3px 0;"><b>💧 湿度:</b> {humidity}%</p>
                 <p style="margin: 3px 0;"><b>🌪️ 风力:</b> {wind}</p>
@@ -117,7 +117,7 @@ def create_temperature_heatmap(city_list, weather_data_list):
             color = get_color_for_temp(temp)
             
             # 使用带温度的标签
-            tooltip = f"{city.get('name', '未知')}: {temp}°C"
+            tooltip = f"{city.name or '未知'}: {temp_label}°C"
             
             # 使用不同大小和颜色的圆圈表示温度
             folium.CircleMarker(
@@ -139,7 +139,7 @@ def create_temperature_heatmap(city_list, weather_data_list):
                     icon=folium.DivIcon(
                         icon_size=(150, 36),
                         icon_anchor=(75, 0),
-                        html=f'<div style="font-size: 12px; font-weight: bold; text-shadow: 1px 1px 1px white; text-align: center; background: none; border: none;">{city.get("name")}<br/>{temp}°C</div>'
+                        html=f'<div style="font-size: 12px; font-weight: bold; text-shadow: 1px 1px 1px white; text-align: center; background: none; border: none;">{city.name}<br/>{temp_label}°C</div>'
                     )
                 ).add_to(heat_map)
             except Exception as e:
@@ -148,8 +148,7 @@ def create_temperature_heatmap(city_list, weather_data_list):
     # 尝试使用plugins添加热力图（如果可用）
     if HAS_PLUGINS:
         try:
-            heat_data = [[float(city.get("lat", 0)), float(city.get("lon", 0)), 
-                        float(weather_data_list[i].get("now", {}).get("temp", 0))]
+            heat_data = [[city.lat or 0, city.lon or 0, weather_data_list[i].temp or 0]
                         for i, city in enumerate(city_list) if i < len(weather_data_list)]
             
             # 使用绝对温度范围的渐变色
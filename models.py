@@ -0,0 +1,212 @@
+# models.py - 数据模型模块
+from dataclasses import dataclass
+
+
+def _float(value):
+    """将接口返回的数字字符串转换为float，缺失或无效时为None"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _int(value):
+    """将接口返回的数字字符串转换为int，缺失或无效时为None"""
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def fmt_number(value, default="N/A"):
+    """显示数字：整数不带小数点，缺失时显示 default"""
+    return default if value is None else f"{value:g}"
+
+
+@dataclass(slots=True, frozen=True)
+class City:
+    """城市信息（GeoAPI 城市搜索结果）"""
+    id: str
+    name: str
+    adm1: str = ""
+    adm2: str = ""
+    country: str = ""
+    lat: float = None
+    lon: float = None
+    tz: str = ""
+    rank: int = None
+
+    @classmethod
+    def from_api(cls, data):
+        """
+        从接口返回的城市字典创建
+        :param data: GeoAPI 的 location 元素（或离线索引返回的同结构字典）
+        """
+        return cls(
+            id=data["id"],
+            name=data.get("name", ""),
+            adm1=data.get("adm1", ""),
+            adm2=data.get("adm2", ""),
+            country=data.get("country", ""),
+            lat=_float(data.get("lat")),
+            lon=_float(data.get("lon")),
+            tz=data.get("tz", ""),
+            rank=_int(data.get("rank")),
+        )
+
+    def to_dict(self):
+        """转换为可JSON序列化的字典（用于城市搜索缓存）"""
+        return {
+            "id": self.id,
+            "name": self.name,
+            "adm1": self.adm1,
+            "adm2": self.adm2,
+            "country": self.country,
+            "lat": self.lat,
+            "lon": self.lon,
+            "tz": self.tz,
+            "rank": self.rank,
+        }
+
+    @property
+    def admin_info(self):
+        """行政区划描述，例如 "广东省/深圳"，上级与本级相同时只显示一级"""
+        return f"{self.adm1}/{self.adm2}" if self.adm1 != self.adm2 else self.adm1
+
+
+@dataclass(slots=True, frozen=True)
+class WeatherNow:
+    """实时天气（/v7/weather/now），数字字段已转换，不保留 fxLink 等链接信息"""
+    obs_time: str
+    temp: float
+    feels_like: float
+    icon: str
+    text: str
+    wind_dir: str
+    wind_scale: str  # 风力等级可能是范围，例如 "3-4"
+    wind_speed: float
+    humidity: int
+    precip: float
+    pressure: int
+    vis: float
+    cloud: int
+    dew: float
+    update_time: str
+    sources: tuple
+    stale: bool = False  # 熔断期间返回的最近一次成功结果，不是实时数据
+
+    @classmethod
+    def from_api(cls, data):
+        """
+        从接口响应创建
+        :param data: 完整的响应字典（包含 now、updateTime 和 refer）
+        """
+        now = data["now"]
+        return cls(
+            obs_time=now.get("obsTime", ""),
+            temp=_float(now.get("temp")),
+            feels_like=_float(now.get("feelsLike")),
+            icon=now.get("icon", ""),
+            text=now.get("text", ""),
+            wind_dir=now.get("windDir", ""),
+            wind_scale=now.get("windScale", ""),
+            wind_speed=_float(now.get("windSpeed")),
+            humidity=_int(now.get("humidity")),
+            precip=_float(now.get("precip")),
+            pressure=_int(now.get("pressure")),
+            vis=_float(now.get("vis")),
+            cloud=_int(now.get("cloud")),
+            dew=_float(now.get("dew")),
+            update_time=data.get("updateTime", ""),
+            sources=tuple((data.get("refer") or {}).get("sources") or ()),
+        )
+
+
+@dataclass(slots=True, frozen=True)
+class WeatherWarning:
+    """天气灾害预警（命名避免与内置的 Warning 冲突）"""
+    id: str
+    sender: str
+    pub_time: str
+    title: str
+    start_time: str
+    end_time: str
+    status: str
+    severity: str
+    severity_color: str
+    type: str
+    type_name: str
+    text: str
+
+    @classmethod
+    def from_api(cls, data):
+        """
+        从接口返回的预警字典创建
+        :param data: /v7/warning/now 的 warning 元素
+        """
+        return cls(
+            id=data["id"],
+            sender=data.get("sender", ""),
+            pub_time=data.get("pubTime", ""),
+            title=data.get("title", ""),
+            start_time=data.get("startTime", ""),
+            end_time=data.get("endTime", ""),
+            status=data.get("status", ""),
+            severity=data.get("severity", ""),
+            severity_color=data.get("severityColor", ""),
+            type=data.get("type", ""),
+            type_name=data.get("typeName", ""),
+            text=data.get("text", ""),
+        )
+
+
+@dataclass(slots=True, frozen=True)
+class WarningReport:
+    """一个地区的预警查询结果"""
+    update_time: str
+    warnings: tuple
+    sources: tuple
+    stale: bool = False  # 熔断期间返回的最近一次成功结果，不是实时数据
+
+    @classmethod
+    def from_api(cls, data):
+        """
+        从接口响应创建
+        :param data: 完整的响应字典（包含 warning、updateTime 和 refer）
+        """
+        return cls(
+            update_time=data.get("updateTime", ""),
+            warnings=tuple(WeatherWarning.from_api(w) for w in data.get("warning") or ()),
+            sources=tuple((data.get("refer") or {}).get("sources") or ()),
+        )
+
+
+if __name__ == "__main__":
+    # 内存对比：缓存原始响应字典与缓存 WeatherNow 对象
+    import json
+    import tracemalloc
+
+    SAMPLE = json.dumps({
+        "code": "200",
+        "updateTime": "2024-06-01T10:32+08:00",
+        "fxLink": "https://www.qweather.com/weather/beijing-101010100.html",
+        "now": {
+            "obsTime": "2024-06-01T10:24+08:00", "temp": "26", "feelsLike": "27", "icon": "101",
+            "text": "多云", "wind360": "180", "windDir": "南风", "windScale": "3", "windSpeed": "15",
+            "humidity": "48", "precip": "0.0", "pressure": "1003", "vis": "16", "cloud": "91", "dew": "14",
+        },
+        "refer": {"sources": ["QWeather"], "license": ["QWeather Developers License"]},
+    }, ensure_ascii=False)
+    COUNT = 10000
+
+    def measure(build):
+        tracemalloc.start()
+        items = [build(json.loads(SAMPLE)) for _ in range(COUNT)]
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return size / len(items)
+
+    dict_size = measure(lambda data: data)
+    model_size = measure(WeatherNow.from_api)
+    print(f"原始字典:   {dict_size:8.0f} 字节/条")
+    print(f"WeatherNow: {model_size:8.0f} 字节/条 ({model_size / dict_size:.0%})")
@@ -0,0 +1,404 @@
+# qweather_client.py - 和风天气异步客户端模块
+import asyncio
+import atexit
+import dataclasses
+import logging
+import os
+import threading
+import time
+import aiohttp
+from dotenv import load_dotenv
+import circuit_breaker
+import city_index
+import codec
+from cache import TTLCache
+from circuit_breaker import RETRY_ATTEMPTS, CircuitOpenError, backoff_delay
+import geo_cache
+from models import City, WarningReport, WeatherNow
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+API_HOST = os.environ.get("API_HOST")
+REQUEST_TIMEOUT = 5  # 单次请求超时（秒）
+POOL_SIZE = int(os.environ.get("QWEATHER_POOL_SIZE", "20"))  # 连接池上限
+KEEPALIVE_TIMEOUT = 30  # 空闲连接保持时间（秒）
+ACCEPT_ENCODING = "gzip, deflate"  # 和风天气按gzip压缩返回，显式声明以免被代理或服务端降级为明文
+BATCH_CONCURRENCY = int(os.environ.get("QWEATHER_BATCH_CONCURRENCY", "8"))  # 批量查询的并发数
+BATCH_DEADLINE = float(os.environ.get("QWEATHER_BATCH_DEADLINE", "15"))  # 批量查询的总时限（秒）
+LAST_GOOD_SIZE = int(os.environ.get("QWEATHER_LAST_GOOD_SIZE", "2048"))  # 保留的最近成功结果条数
+LAST_GOOD_TTL = float(os.environ.get("QWEATHER_LAST_GOOD_TTL", "10800"))  # 熔断期间可返回多久以前的成功结果（秒）
+
+
+class BatchResult:
+    """
+    批量查询结果
+    successes 和 failures 以查询ID为键（已去重，保持首次出现的顺序），
+    timings 记录每个ID的耗时，elapsed 为整批耗时。
+    """
+
+    def __init__(self, ids):
+        self.ids = ids
+        self.successes = {}  # id -> 数据
+        self.failures = {}  # id -> 失败原因
+        self.timings = {}  # id -> 秒
+        self.elapsed = 0.0
+
+    def __len__(self):
+        return len(self.ids)
+
+    def get(self, key, default=None):
+        """获取单个ID的数据，失败时返回 default"""
+        return self.successes.get(key, default)
+
+    def ordered(self, keys):
+        """
+        按给定顺序返回数据
+        :param keys: 查询ID列表（可重复）
+        :return: 数据列表，失败的ID对应None
+        """
+        return [self.successes.get(key) for key in keys]
+
+    def summary(self):
+        """返回结果汇总"""
+        timings = list(self.timings.values())
+        return {
+            "requested": len(self.ids),
+            "succeeded": len(self.successes),
+            "failed": len(self.failures),
+            "elapsed": round(self.elapsed, 3),
+            "max_latency": round(max(timings), 3) if timings else 0.0,
+        }
+
+
+class QWeatherClient:
+    """
+    和风天气异步客户端
+    所有请求共享一个带连接池的 aiohttp 会话，连接保持长连接复用；
+    响应以gzip压缩传输，由 aiohttp 解压后直接从字节解析JSON（安装了 orjson 时使用 orjson）。
+    每个接口有进程内共享的熔断器：失败按指数退避加抖动重试，连续失败后熔断，
+    熔断期间不发送请求，天气和预警查询返回最近一次成功的结果（没有则返回None）。
+    会话在首次请求时于当前事件循环中创建，使用完毕后需调用 close()。
+    """
+
+    def __init__(self, api_host=None, pool_size=POOL_SIZE, timeout=REQUEST_TIMEOUT, city_cache=None,
+                 retries=RETRY_ATTEMPTS):
+        """
+        :param api_host: API主机地址，默认读取环境变量 API_HOST
+        :param pool_size: 连接池最大连接数
+        :param timeout: 单次请求超时（秒）
+        :param city_cache: 城市搜索缓存，默认使用进程内共享的 GeoCache
+        :param retries: 失败后的重试次数
+        """
+        self.api_host = api_host or API_HOST
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.retries = retries
+        self.city_cache = city_cache if city_cache is not None else geo_cache.get_geo_cache()
+        self._last_good = TTLCache(maxsize=LAST_GOOD_SIZE, ttl=LAST_GOOD_TTL)  # (接口, 参数) -> 最近成功的结果
+        self.fallbacks = 0
+        self._session = None
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size,
+                limit_per_host=self.pool_size,
+                keepalive_timeout=KEEPALIVE_TIMEOUT,
+                ttl_dns_cache=300,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={"Accept-Encoding": ACCEPT_ENCODING},
+            )
+        return self._session
+
+    async def close(self):
+        """关闭共享会话并释放连接池"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def _get_json(self, path, token, params, api_host=None):
+        """
+        发送GET请求并解析JSON
+        网络错误、超时、5xx/429响应和无法解析的响应计为接口失败并重试；其他4xx响应不重试，也不计入熔断。
+        :return: 响应数据字典，请求失败时返回None
+        :raises CircuitOpenError: 接口已熔断，未发送请求
+        """
+        headers = {"Authorization": f"Bearer {token}"}
+        # aiohttp 不接受值为 None 的查询参数
+        params = {k: v for k, v in params.items() if v is not None}
+        breaker = circuit_breaker.get_breaker(path)
+
+        for attempt in range(self.retries + 1):
+            breaker.check()
+            try:
+                async with self._get_session().get(
+                    f"{api_host or self.api_host}{path}",
+                    headers=headers,
+                    params=params,
+                ) as response:
+                    response.raise_for_status()
+                    data = codec.loads(await response.read())
+            except aiohttp.ClientResponseError as e:
+                if e.status < 500 and e.status != 429:
+                    breaker.record_success()
+                    logger.error(f"🔌 请求被拒绝：{e.status} {e.message}")
+                    return None
+                error = f"{e.status} {e.message}"
+            except (aiohttp.ClientError, asyncio.TimeoutError, codec.JSONDecodeError) as e:
+                error = repr(e)
+            except BaseException:
+                # 被取消（例如批量查询超时）时不计入成功或失败，只归还试探名额
+                breaker.release()
+                raise
+            else:
+                breaker.record_success()
+                return data
+
+            breaker.record_failure()
+            if attempt < self.retries:
+                delay = backoff_delay(attempt)
+                logger.warning(f"🔌 请求异常：{error}，{delay:.1f}s 后重试（{attempt + 1}/{self.retries}）")
+                await asyncio.sleep(delay)
+            else:
+                logger.error(f"🔌 请求异常：{error}")
+        return None
+
+    def _fallback(self, key, error):
+        """
+        熔断期间返回最近一次成功的结果，标记为 stale=True，调用方据此区分实时数据（不应再写入缓存）
+        :return: 结果或None
+        """
+        value = self._last_good.get(key)
+        if value is None:
+            logger.warning(f"⚡ {error}")
+            return None
+        self.fallbacks += 1
+        logger.info(f"⚡ {error}，返回最近一次成功的结果")
+        return dataclasses.replace(value, stale=True)
+
+    def stats(self):
+        """返回熔断器状态和熔断期间的降级次数"""
+        return {
+            "breakers": circuit_breaker.breaker_stats(),
+            "fallbacks": self.fallbacks,
+            "last_good": len(self._last_good),
+        }
+
+    async def get_weather(self, token, location_id, api_host=None):
+        """
+        获取实时天气数据
+        :param token: API密钥
+        :param location_id: 城市ID
+        :param api_host: API主机地址
+        :return: WeatherNow或None（熔断期间可能是最近一次成功的结果，stale为True）
+        """
+        key = ("/v7/weather/now", location_id)
+        try:
+            data = await self._get_json(
+                "/v7/weather/now", token, {"location": location_id}, api_host
+            )
+        except CircuitOpenError as e:
+            return self._fallback(key, e)
+        if data is None:
+            return None
+        if data.get("code") == "200":
+            weather = WeatherNow.from_api(data)
+            self._last_good.set(key, weather)
+            return weather
+        logger.warning(f"⚠️ 天气查询失败：{data.get('code', '未知错误')}")
+        return None
+
+    async def get_weather_warning(self, token, location, lang="zh", api_host=None):
+        """
+        获取天气灾害预警
+        :param token: API密钥
+        :param location: LocationID或以英文逗号分隔的经度,纬度坐标
+        :param lang: 多语言设置
+        :param api_host: API主机地址
+        :return: WarningReport或None（熔断期间可能是最近一次成功的结果，stale为True）
+        """
+        key = ("/v7/warning/now", location, lang)
+        try:
+            data = await self._get_json(
+                "/v7/warning/now", token, {"location": location, "lang": lang}, api_host
+            )
+        except CircuitOpenError as e:
+            return self._fallback(key, e)
+        if data is None:
+            return None
+        if data.get("code") == "200":
+            report = WarningReport.from_api(data)
+            self._last_good.set(key, report)
+            return report
+        logger.warning(f"⚠️ 预警查询失败：{data.get('code', '未知错误')}")
+        return None
+
+    async def _fetch_many(self, fetch, ids, concurrency, deadline, progress=None):
+        """
+        以有限并发对一组ID执行查询
+        :param fetch: 查询单个ID的协程函数，失败返回None
+        :param ids: ID列表（重复的ID只查询一次）
+        :param concurrency: 并发数
+        :param deadline: 整批时限（秒），到时未完成的查询记为失败
+        :param progress: 可选回调 progress(已完成数, 总数)
+        :return: BatchResult
+        """
+        result = BatchResult(list(dict.fromkeys(ids)))
+        semaphore = asyncio.Semaphore(concurrency)
+        started = time.perf_counter()
+
+        async def fetch_one(key):
+            async with semaphore:
+                begin = time.perf_counter()
+                try:
+                    data = await fetch(key)
+                except Exception as e:
+                    result.failures[key] = repr(e)
+                    return
+                finally:
+                    result.timings[key] = time.perf_counter() - begin
+                    if progress:
+                        progress(len(result.timings), len(result.ids))
+                if data is None:
+                    result.failures[key] = "查询失败"
+                else:
+                    result.successes[key] = data
+
+        tasks = {key: asyncio.ensure_future(fetch_one(key)) for key in result.ids}
+        if tasks:
+            _, pending = await asyncio.wait(tasks.values(), timeout=deadline)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            for key, task in tasks.items():
+                if task in pending:
+                    result.failures[key] = f"超过批量时限 {deadline}s"
+        result.elapsed = time.perf_counter() - started
+        return result
+
+    async def get_weather_many(self, token, location_ids, api_host=None, concurrency=BATCH_CONCURRENCY,
+                               deadline=BATCH_DEADLINE, progress=None):
+        """
+        批量获取实时天气
+        :param token: API密钥
+        :param location_ids: 城市ID列表
+        :param api_host: API主机地址
+        :param concurrency: 并发数
+        :param deadline: 整批时限（秒）
+        :param progress: 可选回调 progress(已完成数, 总数)
+        :return: BatchResult，successes 的值为 WeatherNow
+        """
+        return await self._fetch_many(
+            lambda location_id: self.get_weather(token, location_id, api_host),
+            location_ids, concurrency, deadline, progress,
+        )
+
+    async def get_weather_warning_many(self, token, locations, lang="zh", api_host=None,
+                                       concurrency=BATCH_CONCURRENCY, deadline=BATCH_DEADLINE, progress=None):
+        """
+        批量获取天气灾害预警
+        :param token: API密钥
+        :param locations: LocationID或坐标列表
+        :param lang: 多语言设置
+        :param api_host: API主机地址
+        :param concurrency: 并发数
+        :param deadline: 整批时限（秒）
+        :param progress: 可选回调 progress(已完成数, 总数)
+        :return: BatchResult，successes 的值为 WarningReport
+        """
+        return await self._fetch_many(
+            lambda location: self.get_weather_warning(token, location, lang, api_host),
+            locations, concurrency, deadline, progress,
+        )
+
+    async def search_city(self, token, keyword, api_host=None, adm=None, number=5, lang="zh"):
+        """
+        城市搜索
+        :param token: API密钥
+        :param keyword: 搜索关键词
+        :param api_host: API主机地址
+        :param adm: 上级行政区划过滤
+        :param number: 返回结果数量
+        :param lang: 多语言设置
+        :return: City列表或None
+        """
+        cities = city_index.lookup(keyword, adm, number, lang)
+        if cities:
+            return [City.from_api(city) for city in cities]
+
+        if self.city_cache:
+            # GeoCache 读写 SQLite，放到线程中执行以免阻塞事件循环
+            cached = await asyncio.to_thread(self.city_cache.get, keyword, adm, number, lang)
+            if cached is not geo_cache.MISS:
+                return [City.from_api(city) for city in cached] or None
+
+        params = {"location": keyword, "adm": adm, "number": number, "lang": lang}
+        try:
+            data = await self._get_json("/geo/v2/city/lookup", token, params, api_host)
+        except CircuitOpenError as e:
+            # 离线索引和搜索缓存都已查过，直接失败
+            logger.warning(f"⚡ {e}")
+            return None
+        if data is None:
+            return None
+        if data.get("code") == "200" and data.get("location"):
+            cities = [City.from_api(city) for city in data["location"]]
+            if self.city_cache:
+                await asyncio.to_thread(
+                    self.city_cache.put, keyword, [city.to_dict() for city in cities], adm, number, lang
+                )
+            return cities
+        if data.get("code") == "404" and self.city_cache:
+            # 查询成功但没有匹配的城市，缓存这一结果
+            await asyncio.to_thread(self.city_cache.put, keyword, [], adm, number, lang)
+        logger.warning(f"⚠️ 城市搜索失败：{data.get('code', '未知错误')}")
+        return None
+
+
+# ---- 同步调用支持 ----
+# 命令行工具和邮件脚本是同步代码。它们的请求都在一个常驻后台事件循环中执行，
+# 因此同步调用同样可以复用连接池。
+
+_sync_loop = None
+_sync_client = None
+_sync_lock = threading.Lock()
+
+
+def _ensure_sync_loop():
+    global _sync_loop, _sync_client
+    with _sync_lock:
+        if _sync_loop is None:
+            _sync_loop = asyncio.new_event_loop()
+            _sync_client = QWeatherClient()
+            threading.Thread(
+                target=_sync_loop.run_forever, name="qweather-sync-loop", daemon=True
+            ).start()
+            atexit.register(_shutdown_sync_loop)
+    return _sync_loop
+
+
+def _shutdown_sync_loop():
+    global _sync_loop
+    if _sync_loop is None:
+        return
+    try:
+        asyncio.run_coroutine_threadsafe(_sync_client.close(), _sync_loop).result(timeout=2)
+    except Exception:
+        pass
+    _sync_loop.call_soon_threadsafe(_sync_loop.stop)
+    _sync_loop = None
+
+
+def run_sync(method, *args, **kwargs):
+    """
+    在后台事件循环中执行共享客户端的方法并等待结果
+    :param method: QWeatherClient 的方法名，例如 "get_weather"
+    :return: 方法返回值
+    """
+    loop = _ensure_sync_loop()
+    coro = getattr(_sync_client, method)(*args, **kwargs)
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
@@ -0,0 +1,230 @@
+# rate_limiter.py - 异步限流模块
+import asyncio
+import logging
+import os
+import time
+from datetime import timedelta
+from telegram.error import RetryAfter, TelegramError
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_GLOBAL_RATE = float(os.environ.get("TELEGRAM_GLOBAL_RATE", "25"))  # 全局每秒消息数
+TELEGRAM_CHAT_INTERVAL = float(os.environ.get("TELEGRAM_CHAT_INTERVAL", "1"))  # 同一会话的最小发送间隔（秒）
+TELEGRAM_MAX_RETRY_AFTER = 3  # 单条消息遇到 RetryAfter 的最大重试次数
+CHAT_TABLE_PRUNE_SIZE = 10000  # 会话发送时间表超过该大小时清理过期项
+PROGRESS_EDIT_INTERVAL = float(os.environ.get("PROGRESS_EDIT_INTERVAL", "0.5"))  # 进度消息两次编辑的最小间隔（秒）
+
+
+class TokenBucket:
+    """
+    异步令牌桶
+    以 rate 个/秒的速度补充令牌，最多积累 capacity 个；等待者按先后顺序获取。
+    """
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic):
+        """
+        :param rate: 每秒补充的令牌数
+        :param capacity: 桶容量（允许的突发量），默认等于 rate
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        """获取一个令牌，必要时等待"""
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+def _retry_after_seconds(error):
+    retry_after = error.retry_after
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+class TelegramRateLimiter:
+    """
+    Telegram 发送限流
+    所有发送共享一个全局令牌桶，同一会话两次发送之间至少间隔 chat_interval 秒；
+    收到 RetryAfter 时暂停全部发送指定的时间后重试。
+    """
+
+    def __init__(self, global_rate=TELEGRAM_GLOBAL_RATE, chat_interval=TELEGRAM_CHAT_INTERVAL,
+                 max_retry_after=TELEGRAM_MAX_RETRY_AFTER):
+        """
+        :param global_rate: 全局每秒消息数
+        :param chat_interval: 同一会话的最小发送间隔（秒）
+        :param max_retry_after: 单条消息遇到 RetryAfter 的最大重试次数
+        """
+        self.chat_interval = chat_interval
+        self.max_retry_after = max_retry_after
+        self._bucket = TokenBucket(global_rate)
+        self._chat_next = {}  # chat_id -> 下一次允许发送的时间
+        self._paused_until = 0.0
+        self.sent = 0
+        self.retry_after_count = 0
+        self.retry_after_seconds = 0.0
+        self.chat_waits = 0
+
+    async def _wait_chat(self, chat_id):
+        now = time.monotonic()
+        if len(self._chat_next) > CHAT_TABLE_PRUNE_SIZE:
+            self._chat_next = {k: v for k, v in self._chat_next.items() if v > now}
+        next_allowed = self._chat_next.get(chat_id, 0.0)
+        # 先占位再等待，同一会话的并发发送依次排开
+        self._chat_next[chat_id] = max(now, next_allowed) + self.chat_interval
+        if next_allowed > now:
+            self.chat_waits += 1
+            await asyncio.sleep(next_allowed - now)
+
+    async def _wait_pause(self):
+        while True:
+            delay = self._paused_until - time.monotonic()
+            if delay <= 0:
+                return
+            await asyncio.sleep(delay)
+
+    async def call(self, limit_key, func, *args, **kwargs):
+        """
+        在限流下执行一次发送
+        :param limit_key: 按会话限流的键（通常为目标 chat_id），不会传给 func
+        :param func: 发送协程函数，例如 bot.send_message
+        :return: func 的返回值
+        :raises RetryAfter: 重试次数用尽
+        """
+        await self._wait_chat(limit_key)
+        attempt = 0
+        while True:
+            await self._wait_pause()
+            await self._bucket.acquire()
+            try:
+                result = await func(*args, **kwargs)
+                self.sent += 1
+                return result
+            except RetryAfter as e:
+                attempt += 1
+                delay = _retry_after_seconds(e)
+                self.retry_after_count += 1
+                self.retry_after_seconds += delay
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                if attempt > self.max_retry_after:
+                    raise
+                logger.warning(f"Telegram 限流，暂停发送 {delay:.0f}s（会话 {limit_key}，第 {attempt} 次）")
+
+    async def send_message(self, bot, chat_id, text, **kwargs):
+        """限流发送文本消息"""
+        return await self.call(chat_id, bot.send_message, chat_id=chat_id, text=text, **kwargs)
+
+    def stats(self):
+        """返回限流统计"""
+        return {
+            "sent": self.sent,
+            "retry_after": self.retry_after_count,
+            "retry_after_seconds": round(self.retry_after_seconds, 1),
+            "chat_waits": self.chat_waits,
+            "paused": max(0.0, round(self._paused_until - time.monotonic(), 1)),
+        }
+
+
+class ThrottledMessageEditor:
+    """
+    限制单条消息的编辑频率
+    两次编辑之间至少间隔 min_interval 秒；间隔内的多次更新只保留最新内容，到时一次发送。
+    """
+
+    def __init__(self, message, min_interval=PROGRESS_EDIT_INTERVAL):
+        """
+        :param message: 需要编辑的 telegram.Message
+        :param min_interval: 两次编辑的最小间隔（秒）
+        """
+        self.message = message
+        self.min_interval = min_interval
+        self._last_text = message.text
+        self._last_edit = time.monotonic()
+        self._pending = None
+        self._task = None
+        self.updates = 0
+        self.edits = 0
+
+    def update(self, text):
+        """提交新的进度文本（不等待发送）"""
+        self.updates += 1
+        self._pending = text
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush())
+
+    async def _flush(self):
+        while self._pending is not None:
+            delay = self._last_edit + self.min_interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            text, self._pending = self._pending, None
+            if text == self._last_text:
+                continue
+            try:
+                await self.message.edit_text(text)
+            except RetryAfter as e:
+                # 被限流：推迟下次编辑，没有更新的内容时重发本次文本
+                self._last_edit = time.monotonic() + _retry_after_seconds(e)
+                if self._pending is None:
+                    self._pending = text
+                continue
+            except TelegramError as e:
+                # 进度消息只是提示，编辑失败（内容未变、网络错误等）时跳过本次
+                logger.debug(f"编辑进度消息失败: {e}")
+            self._last_text = text
+            self._last_edit = time.monotonic()
+            self.edits += 1
+
+    async def finish(self, text, **kwargs):
+        """丢弃未发送的进度，立即把消息编辑为最终内容"""
+        self._pending = None
+        if self._task is not None:
+            # 已结束的任务也要取回结果，否则其中的异常会在任务回收时报 "Task exception was never retrieved"
+            self._task.cancel()
+            results = await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            if isinstance(results[0], Exception):
+                logger.debug(f"进度消息更新任务出错: {results[0]!r}")
+        await self.message.edit_text(text, **kwargs)
+        self.edits += 1
+
+
+if __name__ == "__main__":
+    # 使用模拟 Bot 通过限流器发送，检查参数传递和同一会话的发送间隔
+    class _FakeBot:
+        def __init__(self):
+            self.sent = []
+
+        async def send_message(self, chat_id, text, **kwargs):
+            self.sent.append((chat_id, text, kwargs, time.monotonic()))
+
+    async def _demo():
+        bot = _FakeBot()
+        limiter = TelegramRateLimiter(global_rate=50, chat_interval=0.2)
+        await asyncio.gather(
+            limiter.send_message(bot, "1", "a", parse_mode="Markdown"),
+            limiter.send_message(bot, "1", "b"),
+            limiter.send_message(bot, "2", "c"),
+        )
+        assert sorted(text for _, text, _, _ in bot.sent) == ["a", "b", "c"]
+        times = [at for chat_id, _, _, at in bot.sent if chat_id == "1"]
+        assert times[1] - times[0] >= 0.15
+        print("已发送:", [(chat_id, text, kwargs) for chat_id, text, kwargs, _ in bot.sent])
+        print("统计:", limiter.stats())
+
+    asyncio.run(_demo())
@@ -0,0 +1,153 @@
+# reminder_scheduler.py - 定时提醒索引模块
+import logging
+from collections import defaultdict
+from datetime import datetime
+import pytz
+
+logger = logging.getLogger(__name__)
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def _parse_minutes(hhmm):
+    hour, minute = map(int, hhmm.split(":"))
+    return hour * 60 + minute
+
+
+def utc_minute_of_day(utc_now):
+    """UTC时间对应的当天分钟数（0-1439）"""
+    return utc_now.hour * 60 + utc_now.minute
+
+
+class ReminderIndex:
+    """
+    按UTC分钟索引的提醒表
+    每个用户的本地提醒时间按其时区当前的UTC偏移换算为UTC分钟后放入对应的桶，
+    每分钟只需取出一个桶，代价与到期用户数成正比。时区偏移变化（夏令时切换）时，
+    refresh_offsets() 只重建该时区的用户。
+    """
+
+    def __init__(self, default_timezone="Asia/Shanghai"):
+        self.default_timezone = default_timezone
+        self._buckets = defaultdict(set)  # UTC分钟 -> {user_id}
+        self._users = {}  # user_id -> (时区名, 本地分钟列表, UTC分钟列表)
+        self._users_by_tz = defaultdict(set)  # 时区名 -> {user_id}
+        self._tz_offsets = {}  # 时区名 -> 建索引时使用的UTC偏移（分钟）
+        self._timezones = {}  # 时区名 -> tzinfo
+
+    def __len__(self):
+        return len(self._users)
+
+    def _timezone(self, name):
+        tz = self._timezones.get(name)
+        if tz is None:
+            tz = self._timezones[name] = pytz.timezone(name)
+        return tz
+
+    def _offset_minutes(self, tz_name, utc_now):
+        offset = utc_now.astimezone(self._timezone(tz_name)).utcoffset()
+        return int(offset.total_seconds() // 60)
+
+    @staticmethod
+    def is_eligible(data):
+        """用户是否需要定时提醒：已开启、已设置城市且有提醒时间"""
+        return bool(
+            data
+            and data.get("active", True)
+            and data.get("city_id")
+            and data.get("city_name")
+            and data.get("reminder_times")
+        )
+
+    def update_user(self, user_id, data, utc_now=None):
+        """
+        根据用户当前数据更新索引（用户被停用或信息不完整时从索引中移除）
+        :param user_id: 用户ID
+        :param data: 用户数据字典或None
+        :param utc_now: 当前UTC时间，用于确定时区偏移
+        """
+        self.remove_user(user_id)
+        if not self.is_eligible(data):
+            return
+
+        tz_name = data.get("timezone") or self.default_timezone
+        try:
+            local_minutes = sorted({_parse_minutes(t) for t in data["reminder_times"]})
+            if tz_name not in self._tz_offsets:
+                self._tz_offsets[tz_name] = self._offset_minutes(tz_name, utc_now or datetime.now(pytz.UTC))
+        except (ValueError, AttributeError, pytz.exceptions.UnknownTimeZoneError) as e:
+            logger.error(f"用户 {user_id} 的提醒设置无效，已跳过: {e}")
+            return
+
+        self._add(user_id, tz_name, local_minutes)
+
+    def _add(self, user_id, tz_name, local_minutes):
+        offset = self._tz_offsets[tz_name]
+        utc_minutes = [(m - offset) % MINUTES_PER_DAY for m in local_minutes]
+        for minute in utc_minutes:
+            self._buckets[minute].add(user_id)
+        self._users[user_id] = (tz_name, local_minutes, utc_minutes)
+        self._users_by_tz[tz_name].add(user_id)
+
+    def remove_user(self, user_id):
+        """从索引中移除用户"""
+        entry = self._users.pop(user_id, None)
+        if entry is None:
+            return
+        tz_name, _, utc_minutes = entry
+        for minute in utc_minutes:
+            bucket = self._buckets.get(minute)
+            if bucket is not None:
+                bucket.discard(user_id)
+                if not bucket:
+                    del self._buckets[minute]
+        users = self._users_by_tz.get(tz_name)
+        if users is not None:
+            users.discard(user_id)
+            if not users:
+                del self._users_by_tz[tz_name]
+                self._tz_offsets.pop(tz_name, None)
+
+    def rebuild(self, users, utc_now=None):
+        """
+        根据全部用户数据重建索引
+        :param users: {user_id: 用户数据}
+        """
+        utc_now = utc_now or datetime.now(pytz.UTC)
+        self._buckets.clear()
+        self._users.clear()
+        self._users_by_tz.clear()
+        self._tz_offsets.clear()
+        for user_id, data in users.items():
+            self.update_user(user_id, data, utc_now)
+        logger.info(f"提醒索引已重建：{len(self._users)} 个用户，{len(self._buckets)} 个时间点")
+
+    def refresh_offsets(self, utc_now):
+        """
+        检查各时区的UTC偏移是否变化（夏令时切换），变化时重建该时区的用户
+        代价与时区数量成正比
+        :return: 重建的用户数
+        """
+        moved = 0
+        for tz_name in list(self._users_by_tz):
+            offset = self._offset_minutes(tz_name, utc_now)
+            if offset == self._tz_offsets.get(tz_name):
+                continue
+            user_ids = list(self._users_by_tz[tz_name])
+            entries = [(user_id, self._users[user_id][1]) for user_id in user_ids]
+            for user_id in user_ids:
+                self.remove_user(user_id)
+            self._tz_offsets[tz_name] = offset
+            for user_id, local_minutes in entries:
+                self._add(user_id, tz_name, local_minutes)
+            moved += len(entries)
+            logger.info(f"时区 {tz_name} 的UTC偏移变为 {offset} 分钟，已重建 {len(entries)} 个用户的提醒")
+        return moved
+
+    def due(self, minute_of_day):
+        """
+        获取在指定UTC分钟需要提醒的用户
+        :param minute_of_day: UTC当天分钟数
+        :return: 用户ID集合（副本）
+        """
+        return set(self._buckets.get(minute_of_day, ()))
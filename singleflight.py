@@ -0,0 +1,54 @@
+# singleflight.py - 并发请求合并模块
+import asyncio
+
+
+class SingleFlight:
+    """
+    同一个键的并发调用只执行一次
+    第一个调用者启动任务，其余调用者等待同一任务的结果。任务在独立的 Task 中运行，
+    某个等待者被取消不会影响其他等待者。
+    """
+
+    def __init__(self):
+        self._inflight = {}
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+
+    async def do(self, key, func, *args, **kwargs):
+        """
+        执行 func(*args, **kwargs)，同键的并发调用共享一次执行
+        :param key: 合并键
+        :param func: 协程函数
+        :return: func 的返回值（异常同样会传递给所有等待者）
+        """
+        self.calls += 1
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.executions += 1
+            task = asyncio.ensure_future(func(*args, **kwargs))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self._forget(k, t))
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # 标记异常已读取，避免所有等待者都被取消时出现 "exception was never retrieved"
+        if not task.cancelled():
+            task.exception()
+
+    def in_flight(self, key):
+        """键对应的任务是否正在执行"""
+        return key in self._inflight
+
+    def stats(self):
+        """返回合并统计"""
+        return {
+            "calls": self.calls,
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._inflight),
+        }
@@ -0,0 +1,76 @@
+# subscription_index.py - 预警订阅索引模块
+import logging
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+
+class SubscriptionIndex:
+    """
+    城市到订阅用户的倒排索引
+    只包含活跃用户的订阅，按用户增量更新，分发预警时无需遍历全部用户。
+    """
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)  # city_id -> {user_id}
+        self._cities = {}  # city_id -> 城市信息（id、name、adm1）
+        self._user_cities = {}  # user_id -> [city_id, ...]
+
+    def __len__(self):
+        """订阅城市数"""
+        return len(self._subscribers)
+
+    def update_user(self, user_id, data):
+        """
+        根据用户当前数据更新索引（用户被停用时移除其全部订阅）
+        :param user_id: 用户ID
+        :param data: 用户数据字典或None
+        """
+        self.remove_user(user_id)
+        if not data or not data.get("active", True):
+            return
+        city_ids = []
+        for city in data.get("warning_cities") or ():
+            city_id = city["id"]
+            self._subscribers[city_id].add(user_id)
+            self._cities.setdefault(city_id, city)
+            city_ids.append(city_id)
+        if city_ids:
+            self._user_cities[user_id] = city_ids
+
+    def remove_user(self, user_id):
+        """从索引中移除用户的全部订阅"""
+        for city_id in self._user_cities.pop(user_id, ()):
+            subscribers = self._subscribers.get(city_id)
+            if subscribers is None:
+                continue
+            subscribers.discard(user_id)
+            if not subscribers:
+                del self._subscribers[city_id]
+                self._cities.pop(city_id, None)
+
+    def rebuild(self, users):
+        """
+        根据全部用户数据重建索引
+        :param users: {user_id: 用户数据}
+        """
+        self._subscribers.clear()
+        self._cities.clear()
+        self._user_cities.clear()
+        for user_id, data in users.items():
+            self.update_user(user_id, data)
+        logger.info(f"预警订阅索引已重建：{len(self._user_cities)} 个用户，{len(self._subscribers)} 个城市")
+
+    def cities(self):
+        """
+        当前有订阅的城市
+        :return: {city_id: 城市信息}（副本）
+        """
+        return dict(self._cities)
+
+    def subscribers(self, city_id):
+        """
+        订阅了指定城市的用户
+        :return: 用户ID元组（副本，分发过程中可安全修改索引）
+        """
+        return tuple(self._subscribers.get(city_id, ()))
@@ -0,0 +1,265 @@
+# user_store.py - 用户数据存储模块
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+import aiofiles
+from dotenv import load_dotenv
+import codec
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+USER_STORE_BACKEND = os.environ.get("USER_STORE", "sqlite")  # sqlite 或 json
+USER_DATA_FILE = "user_data.json"
+USER_DB_FILE = os.environ.get("USER_DB_FILE", "user_data.db")
+USER_DATA_FLUSH_INTERVAL = float(os.environ.get("USER_DATA_FLUSH_INTERVAL", "5"))  # 写回间隔（秒）
+
+
+class UserStore(ABC):
+    """用户数据存储接口，user_id 为字符串，每个用户的数据为可JSON序列化的字典"""
+
+    @abstractmethod
+    async def load_all(self):
+        """
+        加载所有用户
+        :return: {user_id: 用户数据}
+        """
+
+    @abstractmethod
+    async def save(self, users, user_ids=None):
+        """
+        保存用户数据
+        :param users: 全部用户数据 {user_id: 用户数据}
+        :param user_ids: 需要保存的用户ID，None表示全部
+        """
+
+    async def close(self):
+        """释放资源"""
+
+
+class JsonUserStore(UserStore):
+    """单个JSON文件存储，每次保存都重写整个文件（先写临时文件再替换，保证原子性）"""
+
+    def __init__(self, path=USER_DATA_FILE):
+        self.path = path
+
+    async def load_all(self):
+        if not os.path.exists(self.path):
+            logger.info("用户数据文件不存在，创建新的用户数据")
+            return {}
+        async with aiofiles.open(self.path, "r", encoding="utf-8") as f:
+            return codec.loads(await f.read())
+
+    async def save(self, users, user_ids=None):
+        text = codec.dumps(users, indent=True)
+        tmp_path = f"{self.path}.tmp"
+        async with aiofiles.open(tmp_path, "w", encoding="utf-8") as f:
+            await f.write(text)
+        os.replace(tmp_path, self.path)
+
+
+class SqliteUserStore(UserStore):
+    """
+    SQLite存储（WAL模式），按用户增量写入
+    首次打开空数据库时会自动导入已有的 user_data.json。
+    """
+
+    def __init__(self, path=USER_DB_FILE, legacy_json_path=USER_DATA_FILE):
+        """
+        :param path: 数据库文件路径
+        :param legacy_json_path: 需要迁移的旧JSON文件路径
+        """
+        self.path = path
+        self.legacy_json_path = legacy_json_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS users ("
+                "user_id TEXT PRIMARY KEY, data TEXT NOT NULL, "
+                "active INTEGER NOT NULL DEFAULT 1, city_id TEXT, updated_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_users_city ON users (city_id)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_users_active ON users (active)")
+
+    @staticmethod
+    def _row(user_id, data, now):
+        return (
+            user_id,
+            codec.dumps(data),
+            1 if data.get("active", True) else 0,
+            data.get("city_id"),
+            now,
+        )
+
+    def _upsert(self, rows):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO users (user_id, data, active, city_id, updated_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, active = excluded.active, "
+                "city_id = excluded.city_id, updated_at = excluded.updated_at",
+                rows,
+            )
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _migrate_legacy_json(self):
+        if not self.legacy_json_path or not os.path.exists(self.legacy_json_path):
+            return {}
+        if self._query("SELECT 1 FROM users LIMIT 1"):
+            return {}
+        with open(self.legacy_json_path, "rb") as f:
+            users = codec.loads(f.read())
+        now = time.time()
+        self._upsert([self._row(user_id, data, now) for user_id, data in users.items()])
+        os.replace(self.legacy_json_path, f"{self.legacy_json_path}.migrated")
+        logger.info(f"已将 {len(users)} 条用户数据从 {self.legacy_json_path} 迁移到 {self.path}")
+        return users
+
+    def _load_all(self):
+        migrated = self._migrate_legacy_json()
+        if migrated:
+            return migrated
+        return {user_id: codec.loads(data) for user_id, data in self._query("SELECT user_id, data FROM users")}
+
+    async def load_all(self):
+        return await asyncio.to_thread(self._load_all)
+
+    async def save(self, users, user_ids=None):
+        # 在事件循环线程中完成序列化，写入放到线程中执行
+        now = time.time()
+        ids = users.keys() if user_ids is None else user_ids
+        rows = [self._row(user_id, users[user_id], now) for user_id in ids if user_id in users]
+        if rows:
+            await asyncio.to_thread(self._upsert, rows)
+
+    async def get(self, user_id):
+        """
+        查询单个用户
+        :return: 用户数据或None
+        """
+        rows = await asyncio.to_thread(self._query, "SELECT data FROM users WHERE user_id = ?", (user_id,))
+        return codec.loads(rows[0][0]) if rows else None
+
+    async def user_ids_by_city(self, city_id, active_only=True):
+        """
+        按城市查询用户（使用 city_id 索引）
+        :return: 用户ID列表
+        """
+        sql = "SELECT user_id FROM users WHERE city_id = ?"
+        if active_only:
+            sql += " AND active = 1"
+        rows = await asyncio.to_thread(self._query, sql, (city_id,))
+        return [row[0] for row in rows]
+
+    async def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class WriteBehindUserStore:
+    """
+    写回缓冲
+    修改用户数据时只标记为待保存，由 flush() 定期（或关闭时）一次性写入后端。
+    每次写入是单个原子操作：JSON为临时文件加重命名，SQLite为单个事务。
+    """
+
+    def __init__(self, backend):
+        """
+        :param backend: 实际的 UserStore
+        """
+        self.backend = backend
+        self._dirty = set()
+        self._all_dirty = False
+        self._flush_lock = asyncio.Lock()
+        self.flushes = 0
+        self.flushed_records = 0
+        self.failed_flushes = 0
+        self.last_flush_size = 0
+        self.last_flush_duration = 0.0
+        self.max_flush_duration = 0.0
+
+    async def load_all(self):
+        return await self.backend.load_all()
+
+    def mark_dirty(self, *user_ids):
+        """
+        标记用户为待保存
+        :param user_ids: 用户ID，不传表示全部用户
+        """
+        if user_ids:
+            self._dirty.update(user_ids)
+        else:
+            self._all_dirty = True
+
+    @property
+    def pending(self):
+        """是否有待写入的变更"""
+        return self._all_dirty or bool(self._dirty)
+
+    async def flush(self, users):
+        """
+        将待保存的用户写入后端
+        :param users: 全部用户数据
+        :return: 写入的记录数
+        """
+        async with self._flush_lock:
+            if not self.pending:
+                return 0
+            user_ids = None if self._all_dirty else list(self._dirty)
+            self._dirty = set()
+            self._all_dirty = False
+
+            started = time.perf_counter()
+            try:
+                await self.backend.save(users, user_ids)
+            except Exception:
+                # 写入失败时保留标记，下次重试
+                self.failed_flushes += 1
+                self.mark_dirty(*(user_ids or ()))
+                raise
+            duration = time.perf_counter() - started
+
+            size = len(users) if user_ids is None else len(user_ids)
+            self.flushes += 1
+            self.flushed_records += size
+            self.last_flush_size = size
+            self.last_flush_duration = duration
+            self.max_flush_duration = max(self.max_flush_duration, duration)
+            return size
+
+    def stats(self):
+        """返回写入统计"""
+        return {
+            "pending": len(self._dirty) if not self._all_dirty else "all",
+            "flushes": self.flushes,
+            "flushed_records": self.flushed_records,
+            "failed_flushes": self.failed_flushes,
+            "last_flush_size": self.last_flush_size,
+            "last_flush_duration": round(self.last_flush_duration, 4),
+            "max_flush_duration": round(self.max_flush_duration, 4),
+        }
+
+    async def close(self):
+        await self.backend.close()
+
+
+def create_user_store(backend=USER_STORE_BACKEND):
+    """
+    根据配置创建用户数据存储
+    :param backend: "sqlite" 或 "json"
+    :return: UserStore
+    """
+    if backend == "json":
+        return JsonUserStore()
+    if backend == "sqlite":
+        return SqliteUserStore()
+    raise ValueError(f"未知的用户数据存储类型: {backend}")
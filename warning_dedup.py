@@ -0,0 +1,197 @@
+# warning_dedup.py - 预警去重存储模块
+import logging
+import os
+import time
+from datetime import datetime
+import aiofiles
+from dotenv import load_dotenv
+import codec
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+WARNING_DEDUP_FILE = os.environ.get("WARNING_DEDUP_FILE", "warning_dedup.json")
+WARNING_DEDUP_TTL = 3 * 24 * 3600  # 预警没有结束时间时的保留时长（秒）
+WARNING_DEDUP_GRACE = 24 * 3600  # 结束时间之后继续保留的时长（秒），防止预警延期后重复发送
+WARNING_DEDUP_REFRESH_STEP = 3600  # 续期至少延长多少秒才更新记录，避免每次轮询都写文件
+DEDUP_FILE_VERSION = 1
+
+
+def _parse_end_time(end_time):
+    """解析预警的 endTime（ISO 8601，带时区），失败返回None"""
+    if not end_time:
+        return None
+    try:
+        return datetime.fromisoformat(end_time).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+class WarningDedupStore:
+    """
+    已发送预警记录
+    按预警ID保存过期时间和已通知的用户集合，判断 (预警, 用户) 是否已发送为O(1)；
+    记录在预警结束后自动过期，不会因为条数上限被提前丢弃。
+    """
+
+    def __init__(self, path=WARNING_DEDUP_FILE, default_ttl=WARNING_DEDUP_TTL, grace=WARNING_DEDUP_GRACE):
+        """
+        :param path: 持久化文件路径
+        :param default_ttl: 预警没有结束时间时的保留时长（秒）
+        :param grace: 结束时间之后继续保留的时长（秒）
+        """
+        self.path = path
+        self.default_ttl = default_ttl
+        self.grace = grace
+        self._entries = {}  # warning_id -> [过期时间戳, {user_id}]
+        self.dirty = False
+
+    def __len__(self):
+        """记录的预警数"""
+        return len(self._entries)
+
+    def _expires_at(self, end_time, now):
+        end = _parse_end_time(end_time)
+        return end + self.grace if end is not None else now + self.default_ttl
+
+    def contains(self, warning_id, user_id):
+        """预警是否已发送给该用户"""
+        entry = self._entries.get(warning_id)
+        return entry is not None and user_id in entry[1]
+
+    def add(self, warning_id, user_id, end_time=None):
+        """
+        记录预警已发送给该用户
+        :param warning_id: 预警ID
+        :param user_id: 用户ID
+        :param end_time: 预警的 endTime，用于确定过期时间
+        """
+        now = time.time()
+        entry = self._entries.get(warning_id)
+        if entry is None:
+            entry = self._entries[warning_id] = [self._expires_at(end_time, now), set()]
+        else:
+            self._extend(entry, end_time, now)
+        entry[1].add(user_id)
+        self.dirty = True
+
+    def _extend(self, entry, end_time, now):
+        # 预警延期时结束时间会更新；没有结束时间的预警从现在起重新计算保留时长
+        expires_at = self._expires_at(end_time, now)
+        if expires_at - entry[0] < WARNING_DEDUP_REFRESH_STEP:
+            return False
+        entry[0] = expires_at
+        return True
+
+    def touch(self, warning_id, end_time=None):
+        """
+        预警仍在接口结果中时延长记录的过期时间
+        旧版导入的记录和没有 endTime 的预警使用固定保留时长，
+        持续时间更长的预警如果不续期，记录过期后会被再次发送。
+        :param warning_id: 预警ID
+        :param end_time: 预警当前的 endTime
+        :return: 是否延长
+        """
+        entry = self._entries.get(warning_id)
+        if entry is None or not self._extend(entry, end_time, time.time()):
+            return False
+        self.dirty = True
+        return True
+
+    def purge(self, now=None):
+        """
+        删除已过期的记录
+        :return: 删除的预警数
+        """
+        now = now or time.time()
+        expired = [warning_id for warning_id, (expires_at, _) in self._entries.items() if expires_at <= now]
+        for warning_id in expired:
+            del self._entries[warning_id]
+        if expired:
+            self.dirty = True
+        return len(expired)
+
+    def migrate_user_lists(self, users):
+        """
+        导入旧版用户数据中的 notified_warnings 列表
+        旧字段保留在用户数据中，记录成功写入文件后再用 drop_user_lists() 删除，
+        否则写入失败时发送记录会随用户数据一起丢失。
+        :param users: {user_id: 用户数据}
+        :return: 有旧字段的用户ID列表
+        """
+        migrated = []
+        for user_id, data in users.items():
+            warning_ids = data.get("notified_warnings")
+            if warning_ids is None:
+                continue
+            for warning_id in warning_ids:
+                self.add(warning_id, user_id)
+            migrated.append(user_id)
+        if migrated:
+            logger.info(f"已从 {len(migrated)} 个用户的 notified_warnings 导入预警发送记录")
+        return migrated
+
+    @staticmethod
+    def drop_user_lists(users, user_ids):
+        """
+        从用户数据中删除已导入的 notified_warnings 字段
+        :param users: {user_id: 用户数据}
+        :param user_ids: migrate_user_lists() 返回的用户ID
+        :return: 实际删除了字段的用户ID列表
+        """
+        return [
+            user_id for user_id in user_ids
+            if user_id in users and users[user_id].pop("notified_warnings", None) is not None
+        ]
+
+    async def load(self):
+        """从文件加载记录（文件不存在时为空），同时丢弃已过期的记录"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            async with aiofiles.open(self.path, "r", encoding="utf-8") as f:
+                payload = codec.loads(await f.read())
+            self._entries = {
+                warning_id: [expires_at, set(user_ids)]
+                for warning_id, (expires_at, user_ids) in payload["warnings"].items()
+            }
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.error(f"加载预警发送记录失败，将重新记录: {e}")
+            self._entries = {}
+        self.dirty = False
+        self.purge()
+        logger.info(f"已加载 {len(self._entries)} 条预警发送记录")
+
+    async def flush(self):
+        """
+        清理过期记录，有变更时写入文件（先写临时文件再替换）
+        :return: 是否写入
+        """
+        self.purge()
+        if not self.dirty:
+            return False
+        self.dirty = False
+        payload = {
+            "version": DEDUP_FILE_VERSION,
+            "warnings": {
+                warning_id: [round(expires_at), sorted(user_ids)]
+                for warning_id, (expires_at, user_ids) in self._entries.items()
+            },
+        }
+        text = codec.dumps(payload)
+        tmp_path = f"{self.path}.tmp"
+        try:
+            async with aiofiles.open(tmp_path, "w", encoding="utf-8") as f:
+                await f.write(text)
+            os.replace(tmp_path, self.path)
+        except Exception:
+            self.dirty = True
+            raise
+        return True
+
+    def stats(self):
+        """返回记录统计"""
+        return {
+            "warnings": len(self._entries),
+            "deliveries": sum(len(user_ids) for _, user_ids in self._entries.values()),
+        }
@@ -0,0 +1,238 @@
+# warning_poller.py - 预警轮询模块
+import asyncio
+import logging
+import os
+import time
+from rate_limiter import TokenBucket
+from dotenv import load_dotenv
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+QWEATHER_RPS = float(os.environ.get("QWEATHER_RPS", "5"))  # 和风天气每秒请求上限（按订阅套餐配置）
+WARNING_POLL_CONCURRENCY = int(os.environ.get("WARNING_POLL_CONCURRENCY", "10"))  # 同时进行的预警查询数
+WARNING_CHECK_INTERVAL = float(os.environ.get("WARNING_CHECK_INTERVAL", "1800"))  # 无预警城市的基准轮询间隔（秒）
+# 自适应轮询规则：预警刚变化的城市最快，有预警的城市次之，长期无预警的城市逐步放慢
+WARNING_POLL_TICK = float(os.environ.get("WARNING_POLL_TICK", "300"))  # 检查哪些城市到期的周期（秒）
+WARNING_POLL_CHANGED_INTERVAL = float(os.environ.get("WARNING_POLL_CHANGED_INTERVAL", "300"))
+WARNING_POLL_ACTIVE_INTERVAL = float(os.environ.get("WARNING_POLL_ACTIVE_INTERVAL", "900"))
+WARNING_POLL_MAX_INTERVAL = float(os.environ.get("WARNING_POLL_MAX_INTERVAL", "7200"))
+WARNING_POLL_BACKOFF = float(os.environ.get("WARNING_POLL_BACKOFF", "1.5"))  # 无预警时间隔的增长倍数
+
+
+def warning_signature(warnings):
+    """预警列表的变化标识：预警ID及其发布时间（预警更新时发布时间随之改变）"""
+    return frozenset((w.id, w.pub_time) for w in warnings)
+
+
+class AdaptivePollSchedule:
+    """
+    按城市自适应的轮询计划
+    预警有变化（新增、更新或解除）的城市按 changed_interval 轮询，仍有预警的按 active_interval，
+    无预警的城市每次无变化时间隔乘以 backoff，直到 max_interval。
+    同时按固定 base_interval 轮询的调用量估算节省的请求数。
+    """
+
+    def __init__(self, base_interval=WARNING_CHECK_INTERVAL, changed_interval=WARNING_POLL_CHANGED_INTERVAL,
+                 active_interval=WARNING_POLL_ACTIVE_INTERVAL, max_interval=WARNING_POLL_MAX_INTERVAL,
+                 backoff=WARNING_POLL_BACKOFF, clock=time.monotonic):
+        """
+        :param base_interval: 无预警城市的起始间隔，也是计算节省量的固定间隔基准（秒）
+        :param changed_interval: 预警变化后的间隔（秒）
+        :param active_interval: 仍有预警时的间隔（秒）
+        :param max_interval: 无预警时的最大间隔（秒）
+        :param backoff: 无预警时间隔的增长倍数
+        """
+        self.base_interval = base_interval
+        self.changed_interval = changed_interval
+        self.active_interval = active_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self._clock = clock
+        self._cities = {}  # city_id -> [下次轮询时间, 当前间隔, 预警标识]
+        self._last_tick = None
+        self.polls = 0
+        self.changes = 0
+        self.baseline_calls = 0.0
+
+    def due(self, city_ids):
+        """
+        选出已到轮询时间的城市（新订阅的城市立即到期），并清理已无人订阅的城市
+        :param city_ids: 当前订阅的全部城市ID
+        :return: 到期的城市ID列表
+        """
+        now = self._clock()
+        city_ids = set(city_ids)
+        # 固定间隔轮询在这段时间内会产生的请求数
+        if self._last_tick is None:
+            self.baseline_calls += len(city_ids)
+        else:
+            self.baseline_calls += len(city_ids) * (now - self._last_tick) / self.base_interval
+        self._last_tick = now
+
+        for city_id in [c for c in self._cities if c not in city_ids]:
+            del self._cities[city_id]
+        return [
+            city_id for city_id in city_ids
+            if city_id not in self._cities or self._cities[city_id][0] <= now
+        ]
+
+    def record(self, city_id, warnings):
+        """
+        记录一次轮询结果并安排下次轮询
+        下次轮询时间从本轮 due() 的检查时间算起而不是请求完成的时间，
+        否则请求耗时会让城市错过对应的检查周期，实际间隔多出一个周期。
+        :param warnings: WeatherWarning 列表，查询失败为None
+        """
+        now = self._last_tick if self._last_tick is not None else self._clock()
+        self.polls += 1
+        state = self._cities.get(city_id)
+        if warnings is None:
+            # 查询失败：不改变判断，按不超过基准的间隔重试
+            interval = min(state[1], self.base_interval) if state else self.base_interval
+            signature = state[2] if state else None
+        else:
+            signature = warning_signature(warnings)
+            previous = state[2] if state else frozenset()
+            if signature != previous:
+                self.changes += 1
+                interval = self.changed_interval
+            elif signature:
+                interval = self.active_interval
+            elif state is None or state[1] < self.base_interval:
+                interval = self.base_interval
+            else:
+                interval = min(self.max_interval, state[1] * self.backoff)
+        self._cities[city_id] = [now + interval, interval, signature]
+
+    @property
+    def saved_calls(self):
+        """与固定间隔轮询相比节省的请求数（为负表示多用）"""
+        return self.baseline_calls - self.polls
+
+    def stats(self):
+        """返回轮询计划统计"""
+        intervals = [state[1] for state in self._cities.values()]
+        return {
+            "cities": len(self._cities),
+            "active": sum(1 for state in self._cities.values() if state[2]),
+            "avg_interval": round(sum(intervals) / len(intervals), 1) if intervals else 0.0,
+            "polls": self.polls,
+            "changes": self.changes,
+            "baseline_calls": round(self.baseline_calls, 1),
+            "saved_calls": round(self.saved_calls, 1),
+        }
+
+
+class WarningPoller:
+    """
+    并发轮询多个城市的预警
+    同时进行的查询数由信号量限制，请求速率由令牌桶限制；
+    每轮记录耗时，超过轮询周期时发出告警。设置了 schedule 时每轮只查询到期的城市。
+    """
+
+    def __init__(self, fetch, concurrency=WARNING_POLL_CONCURRENCY, rps=QWEATHER_RPS,
+                 interval=WARNING_CHECK_INTERVAL, schedule=None):
+        """
+        :param fetch: 查询单个城市预警的协程函数 fetch(city_id)，返回预警列表，失败返回None
+        :param concurrency: 同时进行的查询数
+        :param rps: 每秒请求上限
+        :param interval: 轮询周期（秒），用于判断是否超时
+        :param schedule: AdaptivePollSchedule，为None时每轮查询全部城市
+        """
+        self.fetch = fetch
+        self.concurrency = concurrency
+        self.interval = interval
+        self.schedule = schedule
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._bucket = TokenBucket(rps)
+        self.cycles = 0
+        self.overruns = 0
+        self.requests = 0
+        self.failures = 0
+        self.last_cycle_cities = 0
+        self.last_cycle_duration = 0.0
+        self.max_cycle_duration = 0.0
+
+    async def _poll_city(self, city_id):
+        async with self._semaphore:
+            await self._bucket.acquire()
+            self.requests += 1
+            try:
+                warnings = await self.fetch(city_id)
+            except Exception as e:
+                logger.error(f"检查城市 {city_id} 预警时出错: {e}")
+                warnings = None
+            if warnings is None:
+                self.failures += 1
+            if self.schedule is not None:
+                self.schedule.record(city_id, warnings)
+            return warnings
+
+    async def poll(self, city_ids):
+        """
+        轮询一组城市
+        :param city_ids: 城市ID列表
+        :return: {city_id: 预警列表}，只包含本轮查询到预警的城市
+        """
+        city_ids = list(city_ids) if self.schedule is None else self.schedule.due(city_ids)
+        if not city_ids:
+            return {}
+        started = time.perf_counter()
+        results = await asyncio.gather(*(self._poll_city(city_id) for city_id in city_ids))
+        duration = time.perf_counter() - started
+
+        self.cycles += 1
+        self.last_cycle_cities = len(city_ids)
+        self.last_cycle_duration = duration
+        self.max_cycle_duration = max(self.max_cycle_duration, duration)
+        if duration > self.interval:
+            self.overruns += 1
+            logger.warning(
+                f"预警轮询耗时 {duration:.1f}s，超过周期 {self.interval:.0f}s"
+                f"（{len(city_ids)} 个城市），请提高 QWEATHER_RPS 或 WARNING_POLL_CONCURRENCY"
+            )
+        else:
+            logger.info(f"预警轮询完成：{len(city_ids)} 个城市，耗时 {duration:.1f}s")
+        return {city_id: warnings for city_id, warnings in zip(city_ids, results) if warnings}
+
+    def stats(self):
+        """返回轮询统计"""
+        stats = {
+            "cycles": self.cycles,
+            "overruns": self.overruns,
+            "requests": self.requests,
+            "failures": self.failures,
+            "last_cycle_cities": self.last_cycle_cities,
+            "last_cycle_duration": round(self.last_cycle_duration, 3),
+            "max_cycle_duration": round(self.max_cycle_duration, 3),
+        }
+        if self.schedule is not None:
+            stats["schedule"] = self.schedule.stats()
+        return stats
+
+
+if __name__ == "__main__":
+    # 使用模拟查询演示并发与限速
+    from models import WeatherWarning
+
+    async def _fake_fetch(city_id):
+        await asyncio.sleep(0.01)
+        return [WeatherWarning.from_api({"id": f"{city_id}-1"})] if int(city_id) % 20 == 0 else []
+
+    async def _demo():
+        poller = WarningPoller(_fake_fetch, concurrency=10, rps=20, interval=60)
+        found = await poller.poll(str(i) for i in range(60))
+        print(f"有预警的城市: {len(found)}")
+        print("统计:", poller.stats())
+
+        # 用模拟时钟演示自适应轮询：一天内每5分钟检查一次
+        clock = [0.0]
+        adaptive = WarningPoller(_fake_fetch, concurrency=60, rps=1000,
+                                 schedule=AdaptivePollSchedule(clock=lambda: clock[0]))
+        for _ in range(288):
+            await adaptive.poll(str(i) for i in range(60))
+            clock[0] += 300
+        print("自适应轮询统计:", adaptive.schedule.stats())
+
+    asyncio.run(_demo())
@@ -1,8 +1,9 @@
 # weather_api.py - 天气查询功能模块
-import requests
 import os
 from dotenv import load_dotenv
 from tabulate import tabulate
+import qweather_client
+from models import fmt_number
 load_dotenv()
 
 def get_weather(token, location_id, api_host=os.environ.get("API_HOST")):
@@ -11,54 +12,49 @@ def get_weather(token, location_id, api_host=os.environ.get("API_HOST")):
     :param token: API密钥
     :param location_id: 城市ID
     :param api_host: API主机地址
-    :return: 天气数据字典或None
+    :return: WeatherNow或None
     """
-    headers = {"Authorization": f"Bearer {token}"}
+    return qweather_client.run_sync("get_weather", token, location_id, api_host)
 
-    try:
-        response = requests.get(
-            f"{api_host}/v7/weather/now",
-            headers=headers,
-            params={"location": location_id},
-            timeout=5
-        )
-        response.raise_for_status()
-        data = response.json()
 
-        if data["code"] == "200":
-            return data
-        print(f"⚠️ 天气查询失败：{data.get('code', '未知错误')}")
-        return None
-
-    except requests.exceptions.RequestException as e:
-        print(f"🔌 请求异常：{e}")
-        return None
+def get_weather_many(token, location_ids, api_host=os.environ.get("API_HOST"), **kwargs):
+    """
+    批量获取实时天气（有限并发，重复ID只查询一次）
+    :param token: API密钥
+    :param location_ids: 城市ID列表
+    :param api_host: API主机地址
+    :param kwargs: concurrency、deadline、progress，见 QWeatherClient.get_weather_many
+    :return: qweather_client.BatchResult
+    """
+    return qweather_client.run_sync("get_weather_many", token, location_ids, api_host, **kwargs)
 
 
 def display_weather(weather_data, city_info=None):
     """
     显示天气信息
-    :param weather_data: 天气数据字典
-    :param city_info: 可选的城市信息
+    :param weather_data: WeatherNow
+    :param city_info: 可选的城市信息（City）
     """
     if city_info:
-        print(f"\n🌆 城市：{city_info['name']} ({city_info['adm1']})")
+        print(f"\n🌆 城市：{city_info.name} ({city_info.adm1})")
 
-    now = weather_data["now"]
-    print(f"🕒 观测时间：{now['obsTime']}")
-    print(f"🌡 温度：{now['temp']}℃ (体感 {now['feelsLike']}℃)")
-    print(f"🌈 天气：{now['text']} ({now['icon']})")
-    print(f"🌪 风力：{now['windDir']} {now['windScale']}级")
-    print(f"💧 湿度：{now['humidity']}%")
-    print(f"👁 能见度：{now['vis']}公里")
-    print(f"📡 数据源：{' | '.join(weather_data['refer']['sources'])}")
+    now = weather_data
+    if now.stale:
+        print("⚠️ 天气服务暂时不可用，以下为最近一次成功查询的结果")
+    print(f"🕒 观测时间：{now.obs_time}")
+    print(f"🌡 温度：{fmt_number(now.temp)}℃ (体感 {fmt_number(now.feels_like)}℃)")
+    print(f"🌈 天气：{now.text} ({now.icon})")
+    print(f"🌪 风力：{now.wind_dir} {now.wind_scale}级")
+    print(f"💧 湿度：{fmt_number(now.humidity)}%")
+    print(f"👁 能见度：{fmt_number(now.vis)}公里")
+    print(f"📡 数据源：{' | '.join(now.sources)}")
 
 
 def display_multiple_weather(weather_data_list, city_info_list):
     """
     以表格形式显示多个城市的天气对比
-    :param weather_data_list: 多个城市的天气数据列表
-    :param city_info_list: 多个城市的信息列表
+    :param weather_data_list: 多个城市的 WeatherNow 列表
+    :param city_info_list: 多个城市的 City 列表
     """
     if not weather_data_list or not city_info_list:
         print("❌ 没有可显示的天气数据")
@@ -74,18 +70,18 @@ def display_multiple_weather(weather_data_list, city_info_list):
             break
             
         city = city_info_list[i]
-        city_name = f"{city['name']} ({city['adm1']})"
+        city_name = f"{city.name} ({city.adm1})"
         
-        now = weather_data["now"]
+        now = weather_data
         row = [
             city_name,
-            now['text'],
-            now['temp'],
-            now['feelsLike'],
-            now['humidity'],
-            now['windDir'],
-            now['windScale'],
-            now['vis']
+            now.text,
+            now.temp,
+            now.feels_like,
+            now.humidity,
+            now.wind_dir,
+            now.wind_scale,
+            now.vis
         ]
         table_data.append(row)
     
@@ -95,8 +91,8 @@ def display_multiple_weather(weather_data_list, city_info_list):
     
     # 显示观测时间
     if weather_data_list:
-        print(f"\n🕒 观测时间：{weather_data_list[0]['now']['obsTime']}")
-        print(f"📡 数据源：{' | '.join(weather_data_list[0]['refer']['sources'])}")
+        print(f"\n🕒 观测时间：{weather_data_list[0].obs_time}")
+        print(f"📡 数据源：{' | '.join(weather_data_list[0].sources)}")
 
 
 def get_weather_warning(token, location, lang="zh", api_host=os.environ.get("API_HOST")):
@@ -106,69 +102,64 @@ def get_weather_warning(token, location, lang="zh", api_host=os.environ.get("API
     :param location: 需要查询地区的LocationID或以英文逗号分隔的经度,纬度坐标
     :param lang: 多语言设置
     :param api_host: API主机地址
-    :return: 预警数据字典或None
+    :return: WarningReport或None
     """
-    headers = {"Authorization": f"Bearer {token}"}
-    params = {"location": location, "lang": lang}
-
-    try:
-        response = requests.get(
-            f"{api_host}/v7/warning/now",
-            headers=headers,
-            params=params,
-            timeout=5
-        )
-        response.raise_for_status()
-        data = response.json()
+    return qweather_client.run_sync("get_weather_warning", token, location, lang, api_host)
 
-        if data["code"] == "200":
-            return data
-        print(f"⚠️ 预警查询失败：{data.get('code', '未知错误')}")
-        return None
 
-    except requests.exceptions.RequestException as e:
-        print(f"🔌 请求异常：{e}")
-        return None
+def get_weather_warning_many(token, locations, lang="zh", api_host=os.environ.get("API_HOST"), **kwargs):
+    """
+    批量获取天气灾害预警（有限并发，重复地点只查询一次）
+    :param token: API密钥
+    :param locations: LocationID或坐标列表
+    :param lang: 多语言设置
+    :param api_host: API主机地址
+    :param kwargs: concurrency、deadline、progress，见 QWeatherClient.get_weather_warning_many
+    :return: qweather_client.BatchResult
+    """
+    return qweather_client.run_sync("get_weather_warning_many", token, locations, lang, api_host, **kwargs)
 
 
 def display_weather_warning(warning_data, city_info=None):
     """
     显示天气灾害预警信息
-    :param warning_data: 预警数据字典
-    :param city_info: 可选的城市信息
+    :param warning_data: WarningReport
+    :param city_info: 可选的城市信息（City）
     """
     if city_info:
-        print(f"\n📍 查询地区：{city_info['name']} ({city_info['adm1']})")
+        print(f"\n📍 查询地区：{city_info.name} ({city_info.adm1})")
 
-    warnings = warning_data.get("warning", [])
+    if warning_data.stale:
+        print("⚠️ 预警服务暂时不可用，以下为最近一次成功查询的结果")
+    warnings = warning_data.warnings
     if not warnings:
         print("✅ 当前地区无天气灾害预警。")
         return
 
-    print(f"🕒 更新时间：{warning_data.get('updateTime')}")
+    print(f"🕒 更新时间：{warning_data.update_time}")
     
     for warning in warnings:
         print("\n" + "="*40)
-        print(f"📢 {warning.get('title')}")
-        print(f"   - 发布单位: {warning.get('sender', 'N/A')}")
-        print(f"   - 发布时间: {warning.get('pubTime', 'N/A')}")
-        print(f"   - 预警类型: {warning.get('typeName')} ({warning.get('type')})")
-        print(f"   - 预警级别: {warning.get('severity')} ({warning.get('severityColor')})")
-        print(f"   - 状态: {warning.get('status')}")
-        print(f"   - 开始时间: {warning.get('startTime', 'N/A')}")
-        print(f"   - 结束时间: {warning.get('endTime', 'N/A')}")
+        print(f"📢 {warning.title}")
+        print(f"   - 发布单位: {warning.sender or 'N/A'}")
+        print(f"   - 发布时间: {warning.pub_time or 'N/A'}")
+        print(f"   - 预警类型: {warning.type_name} ({warning.type})")
+        print(f"   - 预警级别: {warning.severity} ({warning.severity_color})")
+        print(f"   - 状态: {warning.status}")
+        print(f"   - 开始时间: {warning.start_time or 'N/A'}")
+        print(f"   - 结束时间: {warning.end_time or 'N/A'}")
         print("\n📜 预警详情:")
-        print(warning.get('text'))
+        print(warning.text)
         print("="*40)
 
-    print(f"\n📡 数据源：{' | '.join(warning_data['refer']['sources'])}")
+    print(f"\n📡 数据源：{' | '.join(warning_data.sources)}")
 
 
 def display_multiple_weather_warnings(warning_data_list, city_info_list):
     """
     以表格形式显示多个城市的天气预警
-    :param warning_data_list: 多个城市的天气预警数据列表
-    :param city_info_list: 多个城市的信息列表
+    :param warning_data_list: 多个城市的 WarningReport 列表
+    :param city_info_list: 多个城市的 City 列表
     """
     if not warning_data_list or not city_info_list:
         print("❌ 没有可显示的天气预警数据")
@@ -183,9 +174,9 @@ def display_multiple_weather_warnings(warning_data_list, city_info_list):
             break
 
         city = city_info_list[i]
-        city_name = f"{city['name']} ({city['adm1']})"
+        city_name = f"{city.name} ({city.adm1})"
         
-        warnings = warning_data.get("warning", [])
+        warnings = warning_data.warnings
         if not warnings:
             row = [city_name, "无预警", "-", "-", "-"]
             table_data.append(row)
@@ -194,10 +185,10 @@ def display_multiple_weather_warnings(warning_data_list, city_info_list):
             for warning in warnings:
                 row = [
                     city_name,
-                    warning.get('title'),
-                    warning.get('typeName'),
-                    warning.get('severity'),
-                    warning.get('pubTime')
+                    warning.title,
+                    warning.type_name,
+                    warning.severity,
+                    warning.pub_time
                 ]
                 table_data.append(row)
 
@@ -205,8 +196,8 @@ def display_multiple_weather_warnings(warning_data_list, city_info_list):
     print(tabulate(table_data, headers=headers, tablefmt="grid"))
 
     if has_warning and warning_data_list:
-        print(f"\n🕒 最近更新时间：{warning_data_list[0].get('updateTime', 'N/A')}")
-        print(f"📡 数据源：{' | '.join(warning_data_list[0]['refer']['sources'])}")
+        print(f"\n🕒 最近更新时间：{warning_data_list[0].update_time or 'N/A'}")
+        print(f"📡 数据源：{' | '.join(warning_data_list[0].sources)}")
 
 
 if __name__ == "__main__":
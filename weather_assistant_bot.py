@@ -1,8 +1,5 @@
 import os
-import json
 import logging
-import aiofiles
-import aiohttp
 from datetime import datetime
 from telegram import Update, Bot, InputFile, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.ext import (
@@ -15,16 +12,28 @@ from telegram.ext import (
     CallbackQueryHandler,
 )
 import asyncio
+import time
+from collections import Counter
 import jwt_token
-from weather_api import get_weather, get_weather_warning
-from geo_api import search_city, get_selected_city_data
+from qweather_client import QWeatherClient
+from singleflight import SingleFlight
+from cache import FRESH, MISS, STALE, TTLCache
+from ai_client import GrokClient
+from models import fmt_number
+import broadcast
+from broadcast import BroadcastEngine, BroadcastTimings, group_users_by_city
+from rate_limiter import TelegramRateLimiter, ThrottledMessageEditor
+from warning_poller import WARNING_POLL_TICK, AdaptivePollSchedule, WarningPoller
+from reminder_scheduler import MINUTES_PER_DAY, ReminderIndex, utc_minute_of_day
+from subscription_index import SubscriptionIndex
+from warning_dedup import WarningDedupStore
+from user_store import USER_DATA_FLUSH_INTERVAL, WriteBehindUserStore, create_user_store
 from dotenv import load_dotenv
 from telegram.helpers import escape_markdown
-from telegram.error import Forbidden
+from telegram.error import BadRequest, Forbidden, RetryAfter
 import pytz
 from telegram.request import HTTPXRequest
 import httpx
-weather_cache = {}
 load_dotenv()
 # 配置日志
 logging.basicConfig(
@@ -35,28 +44,73 @@ logger = logging.getLogger(__name__)
 # 配置信息
 API_HOST = os.environ.get("API_HOST")
 TELEGRAM_BOT_TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN")
-USER_DATA_FILE = "user_data.json"
 XAI_API_KEY = os.environ.get("XAI_API_KEY")
 
+# 和风天气异步客户端（共享连接池，在 post_stop 中关闭）
+qweather = QWeatherClient(API_HOST)
+# 和风天气Token提供器（缓存Token并在后台提前刷新）
+token_provider = jwt_token.get_token_provider()
+# 同一城市的并发天气查询只请求一次和风天气和AI
+weather_flight = SingleFlight()
+# 天气条件相同的并发AI请求只调用一次
+ai_flight = SingleFlight()
+
+# 缓存（容量有限，读取时检查过期）
+CACHE_TTL = 5 * 60
+# 天气过期后在宽限期内仍先返回旧数据，同时在后台刷新
+WEATHER_STALE_GRACE = float(os.environ.get("WEATHER_STALE_GRACE", "1800"))
+weather_cache = TTLCache(
+    maxsize=int(os.environ.get("WEATHER_CACHE_SIZE", "2000")), ttl=CACHE_TTL, grace=WEATHER_STALE_GRACE
+)
+# 后台刷新任务 {city_id: Task}（保留引用，避免任务被回收）及各新鲜度的响应计数
+weather_refreshes = {}
+weather_freshness = Counter()
+warning_cache = TTLCache(maxsize=int(os.environ.get("WARNING_CACHE_SIZE", "2000")), ttl=CACHE_TTL)
+# AI建议按量化后的天气条件缓存，条件变化即换键，因此有效期可以更长
+AI_CACHE_TTL = 30 * 60
+ai_cache = TTLCache(maxsize=int(os.environ.get("AI_CACHE_SIZE", "2000")), ttl=AI_CACHE_TTL)
+
+AI_UNAVAILABLE_MESSAGE = "AI分析暂时不可用，请稍后再试。"
+AI_UPDATING_MESSAGE = "AI建议正在随天气数据更新，请稍后再查询。"
+AI_SYSTEM_PROMPT = "你是一个十分侠客仗义的天气助手，根据天气情况给出穿衣建议和雨伞提醒。回答要啰嗦、毒舌、实用，而且必须得是文言文，语言风格像网络热梗古风小生，比如快哉快哉，我应在江湖悠悠。"
+
+# Telegram 发送限流（全局速率、单会话间隔，并遵守 RetryAfter）
+send_limiter = TelegramRateLimiter()
+
+# GROK AI 客户端（在 post_init 中创建，post_stop 中关闭）
+ai_client = None
+
 # 用户数据
 user_data = {}
+# 用户数据存储（由环境变量 USER_STORE 选择 sqlite 或 json），修改先缓冲再定期批量写入
+user_store = WriteBehindUserStore(create_user_store())
 
 # 默认定时提醒时间
 DEFAULT_REMINDER_TIMES = ["06:00", "12:00", "16:00"]
 DEFAULT_TIMEZONE = "Asia/Shanghai"  # 默认时区为北京时间
 
+# 定时提醒索引（UTC分钟 -> 到期用户），随用户数据的修改增量更新
+reminder_index = ReminderIndex(DEFAULT_TIMEZONE)
+# 预警订阅索引（城市 -> 订阅用户），随用户数据的修改增量更新
+subscription_index = SubscriptionIndex()
+# 已发送预警记录（随 flush_user_data 写入文件）
+warning_dedup = WarningDedupStore()
+MAX_CATCHUP_MINUTES = 5  # 定时任务延迟时最多补发的分钟数
+_last_reminder_minute = None
+COMPARE_CONCURRENCY = int(os.environ.get("COMPARE_CONCURRENCY", "5"))  # /compare 同时查询的城市数
+# 正在进行的定时推送和预警推送（关闭时取消）
+current_broadcast = None
+current_warning_broadcast = None
+# 已导入预警发送记录、等待删除旧 notified_warnings 字段的用户
+pending_warning_migration = []
+
 
 async def load_user_data():
     """异步加载用户数据"""
     global user_data
     try:
-        if os.path.exists(USER_DATA_FILE):
-            async with aiofiles.open(USER_DATA_FILE, "r", encoding="utf-8") as f:
-                user_data = json.loads(await f.read())
-            logger.info(f"成功加载用户数据：{len(user_data)} 条记录")
-        else:
-            user_data = {}
-            logger.info("用户数据文件不存在，创建新的用户数据")
+        user_data = await user_store.load_all()
+        logger.info(f"成功加载用户数据：{len(user_data)} 条记录")
     except Exception as e:
         logger.error(f"加载用户数据时出错: {e}")
         user_data = {}
@@ -69,80 +123,234 @@ async def load_user_data():
         if "timezone" not in data:
             data["timezone"] = DEFAULT_TIMEZONE
 
+    reminder_index.rebuild(user_data)
+    subscription_index.rebuild(user_data)
+
+    await warning_dedup.load()
+    # 旧字段在预警发送记录写入文件后才删除（见 flush_user_data）
+    pending_warning_migration[:] = warning_dedup.migrate_user_lists(user_data)
 
-async def save_user_data():
-    """异步保存用户数据"""
+
+async def save_user_data(*user_ids):
+    """
+    标记用户数据待保存（由 flush_user_data 定期批量写入），并同步更新提醒索引和预警订阅索引
+    :param user_ids: 需要保存的用户ID，不传则保存全部用户
+    """
+    user_store.mark_dirty(*user_ids)
+    if user_ids:
+        for user_id in user_ids:
+            reminder_index.update_user(user_id, user_data.get(user_id))
+            subscription_index.update_user(user_id, user_data.get(user_id))
+    else:
+        reminder_index.rebuild(user_data)
+        subscription_index.rebuild(user_data)
+    return True
+
+
+async def flush_user_data(context: CallbackContext = None):
+    """将待保存的用户数据和预警发送记录写入存储（定时任务及关闭时调用）"""
+    try:
+        await warning_dedup.flush()
+    except Exception as e:
+        logger.error(f"保存预警发送记录时出错: {e}")
+    else:
+        if pending_warning_migration:
+            dropped = warning_dedup.drop_user_lists(user_data, pending_warning_migration)
+            pending_warning_migration.clear()
+            if dropped:
+                user_store.mark_dirty(*dropped)
     try:
-        async with aiofiles.open(USER_DATA_FILE, "w", encoding="utf-8") as f:
-            await f.write(json.dumps(user_data, ensure_ascii=False, indent=2))
-        logger.info(f"成功保存用户数据：{len(user_data)} 条记录")
+        size = await user_store.flush(user_data)
+        if size:
+            logger.debug(
+                f"成功保存用户数据：{size} 条记录，耗时 {user_store.last_flush_duration * 1000:.1f}ms"
+            )
         return True
     except Exception as e:
         logger.error(f"保存用户数据时出错: {e}")
         return False
 
 
+async def get_qweather_token():
+    """获取和风天气Token，失败时记录日志并返回None"""
+    try:
+        return await token_provider.get_token_async()
+    except jwt_token.TokenError as e:
+        logger.error(f"生成和风天气Token失败: {e}")
+        return None
+
+
 async def get_grok_ai_response(prompt):
     """异步调用GROK AI获取智能回复"""
-    try:
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {XAI_API_KEY}",
-        }
-        data = {
-            "messages": [
-                {
-                    "role": "system",
-                    "content": "你是一个十分侠客仗义的天气助手，根据天气情况给出穿衣建议和雨伞提醒。回答要啰嗦、毒舌、实用，而且必须得是文言文，语言风格像网络热梗古风小生，比如快哉快哉，我应在江湖悠悠。"
-                },
-                {"role": "user", "content": prompt}
-            ],
-            "model": "grok-3-mini-beta",
-            "stream": False,
-            "temperature": 0.5
-        }
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                "https://api.x.ai/v1/chat/completions",
-                headers=headers,
-                json=data,
-                timeout=aiohttp.ClientTimeout(total=10),
-            ) as response:
-                if response.status == 200:
-                    response_data = await response.json()
-                    return response_data["choices"][0]["message"]["content"]
-                else:
-                    logger.error(
-                        f"GROK AI 请求失败: {response.status}, {await response.text()}"
-                    )
-                    return "AI分析暂时不可用，请稍后再试。"
-    except Exception as e:
-        logger.error(f"调用GROK AI时出错: {e}")
-        return "AI分析暂时不可用，请稍后再试。"
+    if ai_client is None:
+        logger.error("GROK AI 客户端尚未初始化")
+        return AI_UNAVAILABLE_MESSAGE
+    reply = await ai_client.complete(prompt)
+    return reply or AI_UNAVAILABLE_MESSAGE
 
 
 async def get_city_weather(city_id):
-    # 添加缓存机制（示例）
-    cache_key = f"weather_{city_id}"
-    if cache_key in weather_cache:
-        return weather_cache[cache_key]
+    """
+    异步获取城市天气并加入AI分析，同一城市的并发调用共享一次查询
+    缓存过期但仍在宽限期内时直接返回旧数据（不等待AI），并在后台刷新天气和AI建议
+    :return: (WeatherNow或None, AI建议或错误提示, FRESH/STALE/MISS)
+    """
+    entry = weather_cache.get_entry(city_id)
+    if entry is not None:
+        weather_data, stale = entry
+        signature = weather_signature(weather_data)
+        ai_suggestion = ai_cache.get(signature)
+        if stale:
+            refresh_city_weather(city_id)
+            weather_freshness[STALE] += 1
+            return weather_data, ai_suggestion or AI_UPDATING_MESSAGE, STALE
+        if ai_suggestion is None:
+            ai_suggestion = await ai_flight.do(signature, fetch_ai_suggestion, signature, weather_data)
+        weather_freshness[FRESH] += 1
+        return weather_data, ai_suggestion, FRESH
+    weather_data, ai_suggestion = await weather_flight.do(city_id, fetch_city_weather, city_id)
+    # 熔断期间返回的旧结果按旧数据标注
+    freshness = STALE if weather_data is not None and weather_data.stale else MISS
+    weather_freshness[freshness] += 1
+    return weather_data, ai_suggestion, freshness
+
+
+def refresh_city_weather(city_id):
+    """在后台刷新城市天气，该城市已有查询或刷新进行中时不重复发起"""
+    if city_id in weather_refreshes or weather_flight.in_flight(city_id):
+        return
+    task = asyncio.ensure_future(weather_flight.do(city_id, fetch_city_weather, city_id))
+    weather_refreshes[city_id] = task
+    task.add_done_callback(lambda t, k=city_id: _weather_refresh_done(k, t))
+
+
+def _weather_refresh_done(city_id, task):
+    if weather_refreshes.get(city_id) is task:
+        del weather_refreshes[city_id]
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"后台刷新城市 {city_id} 天气失败: {task.exception()!r}")
+
+
+async def get_weather_data_many(token, city_ids):
+    """
+    批量获取实时天气（不生成AI建议）：缓存命中的直接使用，其余一次批量查询并写入缓存
+    已有单城市查询进行中的城市不重复请求，等待该查询的结果
+    :param token: API令牌
+    :param city_ids: 城市ID列表
+    :return: {city_id: WeatherNow}，只包含成功的城市
+    """
+    weather = {}
+    missing = []
+    in_flight = []
+    for city_id in dict.fromkeys(city_ids):
+        weather_data = weather_cache.get(city_id)
+        if weather_data is not None:
+            weather[city_id] = weather_data
+        elif weather_flight.in_flight(city_id):
+            in_flight.append(city_id)
+        else:
+            missing.append(city_id)
 
-    """异步获取城市天气并加入AI分析"""
-    token = jwt_token.generate_qweather_token()
+    async def join(city_id):
+        # 合并到进行中的查询（其中包含AI建议，这里只取天气）
+        weather_data, _ = await weather_flight.do(city_id, fetch_city_weather, city_id)
+        return weather_data
+
+    async def fetch_missing():
+        if not missing:
+            return
+        batch = await qweather.get_weather_many(token, missing, concurrency=COMPARE_CONCURRENCY)
+        for city_id, weather_data in batch.successes.items():
+            if not weather_data.stale:
+                weather_cache.set(city_id, weather_data)
+            weather[city_id] = weather_data
+        if batch.failures:
+            logger.warning(f"批量天气查询部分失败: {batch.failures}")
+        logger.debug(f"批量天气查询: {batch.summary()}")
+
+    joined, _ = await asyncio.gather(
+        asyncio.gather(*(join(city_id) for city_id in in_flight), return_exceptions=True),
+        fetch_missing(),
+    )
+    for city_id, weather_data in zip(in_flight, joined):
+        if isinstance(weather_data, Exception):
+            logger.warning(f"城市 {city_id} 天气查询失败: {weather_data!r}")
+        elif weather_data is not None:
+            weather[city_id] = weather_data
+    return weather
+
+
+async def fetch_city_weather(city_id):
+    """
+    查询天气（WeatherNow）和AI建议并写入缓存（熔断期间返回的旧结果不写入天气缓存）
+    调用方已查过缓存，这里不再读取，以免同一次查询被重复计入缓存统计
+    """
+    token = await get_qweather_token()
     if not token:
         return None, "无法生成天气API令牌"
 
-    weather_data = get_weather(token, city_id, API_HOST)
+    weather_data = await qweather.get_weather(token, city_id)
     if not weather_data:
         return None, "获取天气数据失败"
+    if not weather_data.stale:
+        weather_cache.set(city_id, weather_data)
+
+    signature = weather_signature(weather_data)
+    ai_suggestion = ai_cache.get(signature)
+    if ai_suggestion is None:
+        ai_suggestion = await ai_flight.do(signature, fetch_ai_suggestion, signature, weather_data)
+    return weather_data, ai_suggestion
 
-    now = weather_data["now"]
-    prompt = (
+
+async def fetch_ai_suggestion(signature, now):
+    """调用AI生成建议，并按天气条件签名缓存"""
+    ai_suggestion = await get_grok_ai_response(build_weather_prompt(now))
+    # 不缓存失败提示，下次查询时重试
+    if ai_suggestion != AI_UNAVAILABLE_MESSAGE:
+        ai_cache.set(signature, ai_suggestion)
+    return ai_suggestion
+
+
+def _bucket(value, size):
+    return None if value is None else int(value // size)
+
+
+def _wind_band(wind_scale):
+    try:
+        scale = int(str(wind_scale).split("-")[-1])
+    except ValueError:
+        return None
+    if scale <= 2:
+        return "calm"
+    if scale <= 4:
+        return "breeze"
+    if scale <= 6:
+        return "strong"
+    return "gale"
+
+
+def weather_signature(now):
+    """
+    将实时天气量化为AI建议的缓存键
+    温度和体感温度按3°C分档，湿度按25%分档，风力分为四个等级，天气现象保持原文。
+    """
+    return (
+        now.text,
+        _bucket(now.temp, 3),
+        _bucket(now.feels_like, 3),
+        _bucket(now.humidity, 25),
+        _wind_band(now.wind_scale),
+    )
+
+
+def build_weather_prompt(now):
+    """根据实时天气构建AI提示词"""
+    return (
         f"我所在城市的当前天气情况如下:\n"
-        f"天气: {now['text']}\n"
-        f"温度: {now['temp']}°C (体感温度 {now['feelsLike']}°C)\n"
-        f"湿度: {now['humidity']}%\n"
-        f"风向: {now['windDir']}, 风力等级: {now['windScale']}级\n\n"
+        f"天气: {now.text}\n"
+        f"温度: {fmt_number(now.temp)}°C (体感温度 {fmt_number(now.feels_like)}°C)\n"
+        f"湿度: {fmt_number(now.humidity)}%\n"
+        f"风向: {now.wind_dir}, 风力等级: {now.wind_scale}级\n\n"
         f"请根据以上天气情况，给我提供:\n"
         f"1. 今天应该怎么穿衣服的建议\n"
         f"2. 是否需要带伞\n"
@@ -150,25 +358,54 @@ async def get_city_weather(city_id):
         f"请用简洁友好的中文回答，不要太长。"
     )
 
-    ai_suggestion = await get_grok_ai_response(prompt)
-    weather_cache[cache_key] = (weather_data, ai_suggestion)
 
-    # 创建一个异步任务来处理缓存过期，但不等待它完成
-    asyncio.create_task(expire_cache(cache_key))
-    return weather_data, ai_suggestion
+async def get_city_warnings(token, city_id, use_cache=True):
+    """
+    获取城市当前预警列表（带缓存）
+    :param use_cache: 为False时跳过缓存直接查询（结果仍写入缓存）
+    :return: WeatherWarning元组（无预警时为空），查询失败时返回None
+    熔断期间返回的旧结果可能包含已解除的预警或缺少新预警，按查询失败处理
+    """
+    warnings = warning_cache.get(city_id) if use_cache else None
+    if warnings is not None:
+        return warnings
+    warning_data = await qweather.get_weather_warning(token, city_id)
+    if warning_data is None or warning_data.stale:
+        return None
+    warnings = warning_data.warnings
+    warning_cache.set(city_id, warnings)
+    return warnings
+
+
+async def poll_city_warnings(city_id):
+    """预警轮询使用的单城市查询（Token由提供器缓存，轮询间隔由计划决定，因此不读缓存）"""
+    token = await get_qweather_token()
+    if not token:
+        return None
+    return await get_city_warnings(token, city_id, use_cache=False)
+
 
-# 创建一个单独的异步函数来处理缓存过期
-async def expire_cache(cache_key):
-    await asyncio.sleep(5*60)
-    weather_cache.pop(cache_key, None)
+# 预警轮询器（并发与每秒请求数受限，每个城市按自适应计划轮询）
+warning_poller = WarningPoller(poll_city_warnings, interval=WARNING_POLL_TICK, schedule=AdaptivePollSchedule())
 
 
+def log_cache_stats():
+    """记录各缓存、和风天气接口熔断及AI客户端的统计信息"""
+    logger.info(
+        f"缓存统计 天气: {weather_cache.stats()}, 预警: {warning_cache.stats()}, AI: {ai_cache.stats()}"
+    )
+    logger.info(f"天气响应新鲜度: {dict(weather_freshness)}, 后台刷新中: {len(weather_refreshes)}")
+    logger.info(f"和风天气接口统计: {qweather.stats()}")
+    if ai_client is not None:
+        logger.info(f"GROK AI 调用统计: {ai_client.stats()}")
 
-def format_telegram_message(weather_data, ai_suggestion, city_name=None, timezone=DEFAULT_TIMEZONE):
+
+def format_telegram_message(weather_data, ai_suggestion, city_name=None, timezone=DEFAULT_TIMEZONE,
+                            freshness=FRESH):
     if not weather_data:
         return "❌ 无法获取天气数据"
 
-    now = weather_data["now"]
+    now = weather_data
     msg = []
     safe_city = escape_markdown(str(city_name)) if city_name else None
     
@@ -187,14 +424,20 @@ def format_telegram_message(weather_data, ai_suggestion, city_name=None, timezon
     msg.append(title)
 
     weather_details = [
-        f"🌡️ *温度*: {escape_markdown(str(now['temp']))}°C "
-        f"(体感 {escape_markdown(str(now['feelsLike']))}°C)",
-        f"☁️ *天气*: {escape_markdown(now['text'])}",
-        f"💨 *风向*: {escape_markdown(now['windDir'])} "
-        f"{escape_markdown(now['windScale'])}级",
-        f"💧 *湿度*: {escape_markdown(str(now['humidity']))}%",
-        f"👁️ *能见度*: {escape_markdown(str(now['vis']))}公里"
+        f"🌡️ *温度*: {escape_markdown(fmt_number(now.temp))}°C "
+        f"(体感 {escape_markdown(fmt_number(now.feels_like))}°C)",
+        f"☁️ *天气*: {escape_markdown(now.text)}",
+        f"💨 *风向*: {escape_markdown(now.wind_dir)} "
+        f"{escape_markdown(now.wind_scale)}级",
+        f"💧 *湿度*: {escape_markdown(fmt_number(now.humidity))}%",
+        f"👁️ *能见度*: {escape_markdown(fmt_number(now.vis))}公里"
     ]
+    if now.stale:
+        # 天气接口熔断，返回的是最近一次成功的结果
+        weather_details.append(f"⚠️ _天气服务暂时不可用，以下为 {escape_markdown(now.obs_time)} 的观测数据_")
+    elif freshness == STALE:
+        # 宽限期内返回的旧数据，注明观测时间
+        weather_details.append(f"⏳ _观测于 {escape_markdown(now.obs_time)}，数据正在更新_")
     msg.extend(["", *weather_details, ""])
 
     # AI 建议处理
@@ -219,17 +462,14 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "active": True,
             "reminder_times": DEFAULT_REMINDER_TIMES.copy(),
             "timezone": DEFAULT_TIMEZONE,
-            "warning_cities": [],
-            "notified_warnings": []
+            "warning_cities": []
         }
     else:
         user_data[user_id]["active"] = True
         if "warning_cities" not in user_data[user_id]:
             user_data[user_id]["warning_cities"] = []
-        if "notified_warnings" not in user_data[user_id]:
-            user_data[user_id]["notified_warnings"] = []
             
-    await save_user_data()
+    await save_user_data(user_id)
     # 使用 context.bot 发送消息
     await context.bot.send_message(
         chat_id=update.effective_chat.id,
@@ -294,12 +534,12 @@ async def set_city_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     city_name = " ".join(args)
     await update.message.reply_text(f"🔍 正在搜索城市: {city_name}...")
 
-    token = jwt_token.generate_qweather_token()
+    token = await get_qweather_token()
     if not token:
         await update.message.reply_text("❌ 无法生成天气API令牌，请稍后再试")
         return
 
-    cities = search_city(token, city_name, API_HOST)
+    cities = await qweather.search_city(token, city_name)
     if not cities:
         await update.message.reply_text(
             f"❌ 没有找到城市 '{city_name}'，请检查拼写或尝试其他城市名称"
@@ -308,11 +548,11 @@ async def set_city_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     if len(cities) == 1:
         city = cities[0]
-        user_data[user_id]["city_id"] = city["id"]
-        user_data[user_id]["city_name"] = f"{city['name']}"
-        if city["name"] != city["adm1"]:
-            user_data[user_id]["city_name"] += f" ({city['adm1']})"
-        await save_user_data()
+        user_data[user_id]["city_id"] = city.id
+        user_data[user_id]["city_name"] = f"{city.name}"
+        if city.name != city.adm1:
+            user_data[user_id]["city_name"] += f" ({city.adm1})"
+        await save_user_data(user_id)
 
         await update.message.reply_text(
             f"✅ 已将您的城市设置为: {user_data[user_id]['city_name']}\n\n"
@@ -321,12 +561,7 @@ async def set_city_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         msg = ["找到多个城市，请选择一个:"]
         for i, city in enumerate(cities[:5], 1):
-            admin_info = (
-                f"{city['adm1']}/{city['adm2']}"
-                if city["adm1"] != city["adm2"]
-                else city["adm1"]
-            )
-            msg.append(f"{i}. {city['name']} ({admin_info}), {city['country']}")
+            msg.append(f"{i}. {city.name} ({city.admin_info}), {city.country}")
         msg.append("\n请回复数字(1-5)选择城市")
 
         await update.message.reply_text("\n".join(msg))
@@ -372,8 +607,8 @@ async def weather_command(update: Update, _context: ContextTypes.DEFAULT_TYPE):
     city_name = user_data[user_id]["city_name"]
     timezone = user_data[user_id].get("timezone", DEFAULT_TIMEZONE)
 
-    weather_data, ai_suggestion = await get_city_weather(city_id)
-    message = format_telegram_message(weather_data, ai_suggestion, city_name, timezone)
+    weather_data, ai_suggestion, freshness = await get_city_weather(city_id)
+    message = format_telegram_message(weather_data, ai_suggestion, city_name, timezone, freshness)
     await update.message.reply_text(message, parse_mode="Markdown")
 
 
@@ -418,7 +653,7 @@ async def stop_command(update: Update, _context: ContextTypes.DEFAULT_TYPE):
     else:
         user_data[user_id]["active"] = False
 
-    await save_user_data()
+    await save_user_data(user_id)
     await update.message.reply_text(
         "✅ 已暂停天气提醒\n"
         "您还可以随时使用 /weather 查询当前天气\n"
@@ -437,11 +672,11 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
             if 1 <= choice <= len(cities):
                 city = cities[choice - 1]
-                user_data[user_id]["city_id"] = city["id"]
-                user_data[user_id]["city_name"] = f"{city['name']}"
-                if city["name"] != city["adm1"]:
-                    user_data[user_id]["city_name"] += f" ({city['adm1']})"
-                await save_user_data()
+                user_data[user_id]["city_id"] = city.id
+                user_data[user_id]["city_name"] = f"{city.name}"
+                if city.name != city.adm1:
+                    user_data[user_id]["city_name"] += f" ({city.adm1})"
+                await save_user_data(user_id)
 
                 await update.message.reply_text(
                     f"✅ 已将您的城市设置为: {user_data[user_id]['city_name']}\n\n"
@@ -457,7 +692,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if context.user_data.get("waiting_for_time_settings"):
         if text.lower() == "default":
             user_data[user_id]["reminder_times"] = DEFAULT_REMINDER_TIMES.copy()
-            await save_user_data()
+            await save_user_data(user_id)
             await update.message.reply_text(
                 f"✅ 已恢复默认提醒时间: {', '.join(DEFAULT_REMINDER_TIMES)}"
             )
@@ -487,7 +722,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     return
 
                 user_data[user_id]["reminder_times"] = valid_times
-                await save_user_data()
+                await save_user_data(user_id)
                 await update.message.reply_text(
                     f"✅ 已设置提醒时间: {', '.join(valid_times)}"
                 )
@@ -507,106 +742,148 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 
+def _minutes_to_process(minute):
+    """返回本次需要处理的UTC分钟（包含因任务延迟而错过的分钟）"""
+    global _last_reminder_minute
+    last, _last_reminder_minute = _last_reminder_minute, minute
+    if last is None:
+        return [minute]
+    gap = (minute - last) % MINUTES_PER_DAY
+    start = max(1, gap - MAX_CATCHUP_MINUTES + 1)
+    return [(last + i) % MINUTES_PER_DAY for i in range(start, gap + 1)]
+
+
 async def send_scheduled_weather(context: CallbackContext):
-    """优化的定时天气推送"""
+    """每分钟执行的定时天气推送，只处理本分钟到期的用户"""
     try:
-        # 获取UTC时间
         utc_now = datetime.now(pytz.UTC)
-        logger.debug(f"开始执行定时任务，当前UTC时间: {utc_now}")
-
-        # 使用深拷贝避免数据修改冲突
-        users = user_data.copy().items()
-
-        # 批量处理用户
-        tasks = []
-        for user_id, data in users:
-            if validate_user_timezone(data, utc_now):
-                tasks.append(
-                    send_user_weather(
-                        context.bot,
-                        user_id,
-                        data["city_id"],
-                        data["city_name"]
-                    )
-                )
+        reminder_index.refresh_offsets(utc_now)
+
+        due_users = set()
+        for minute in _minutes_to_process(utc_minute_of_day(utc_now)):
+            due_users |= reminder_index.due(minute)
+        if not due_users:
+            return
+        city_groups = group_users_by_city(due_users, user_data)
+        logger.info(
+            f"定时推送：{len(due_users)} 个用户到期，涉及 {len(city_groups)} 个城市，当前UTC时间: {utc_now:%H:%M}"
+        )
+        await run_weather_broadcast(context.bot, city_groups)
 
-        # 控制并发速率（每秒20条）
-        for i in range(0, len(tasks), 20):
-            await asyncio.gather(*tasks[i:i + 20])
-            await asyncio.sleep(1)
+        logger.info(f"天气查询合并统计: {weather_flight.stats()}, AI请求合并统计: {ai_flight.stats()}")
+        log_cache_stats()
 
     except Exception as e:
         logger.error(f"定时任务执行失败: {str(e)}", exc_info=True)
 
 
-def validate_user_timezone(data: dict, utc_now: datetime) -> bool:
-    """基于时区的用户验证逻辑"""
-    try:
-        # 获取用户时区
-        timezone = data.get("timezone", DEFAULT_TIMEZONE)
-        tz = pytz.timezone(timezone)
-        
-        # 将UTC时间转换为用户时区
-        user_time = utc_now.astimezone(tz)
-        current_time = user_time.strftime("%H:%M")
-        
-        # 验证用户是否活跃、是否设置了城市、当前时间是否在提醒时间列表中
-        return (
-            data.get("active", True) and
-            data.get("city_id") and
-            current_time in data.get("reminder_times", []) and
-            data.get("city_name")
-        )
-    except Exception as e:
-        logger.error(f"验证用户时区时出错: {e}")
-        return False
+async def run_weather_broadcast(bot: Bot, city_groups):
+    """
+    通过工作队列推送天气：用户按城市顺序入队，每个城市在本次推送中只查询一次
+    :param city_groups: {city_id: [user_id, ...]}
+    """
+    global current_broadcast
+    timings = BroadcastTimings()
+    city_results = {}
+
+    async def city_weather(city_id):
+        task = city_results.get(city_id)
+        if task is None:
+            task = city_results[city_id] = asyncio.ensure_future(fetch_city_for_broadcast(city_id, timings))
+        return await task
+
+    async def deliver(item):
+        user_id, city_id = item
+        data = user_data.get(user_id)
+        if not ReminderIndex.is_eligible(data) or data["city_id"] != city_id:
+            return broadcast.SKIPPED
+        weather_data, ai_suggestion, freshness = await city_weather(city_id)
+        if not weather_data:
+            return broadcast.FAILED
+        return await send_user_weather(bot, user_id, data["city_name"], weather_data, ai_suggestion, timings,
+                                       freshness)
 
+    def items():
+        for city_id, user_ids in city_groups.items():
+            for user_id in user_ids:
+                yield user_id, city_id
 
-async def send_user_weather(bot: Bot, user_id: str, city_id: str, city_name: str):
-    """发送单个用户天气信息"""
+    current_broadcast = BroadcastEngine(deliver, name="定时推送")
+    try:
+        progress = await current_broadcast.run(items())
+        logger.info(f"定时推送完成: {progress}")
+    finally:
+        current_broadcast = None
+        for task in city_results.values():
+            task.cancel()
+        logger.info(f"定时推送耗时统计: {timings.summary()}, 限流统计: {send_limiter.stats()}")
+
+
+async def fetch_city_for_broadcast(city_id: str, timings: BroadcastTimings):
+    """为推送查询单个城市的天气和AI建议，并记录耗时"""
+    started = time.perf_counter()
+    try:
+        return await get_city_weather(city_id)
+    except Exception as e:
+        logger.error(f"城市 {city_id} 天气查询失败: {e}", exc_info=True)
+        return None, None, MISS
+    finally:
+        timings.record_city(city_id, time.perf_counter() - started)
+
+
+async def send_user_weather(bot: Bot, user_id: str, city_name: str, weather_data, ai_suggestion,
+                            timings: BroadcastTimings = None, freshness=FRESH):
+    """
+    发送单个用户天气信息（天气数据和AI建议由调用方按城市查询）
+    :param freshness: 天气数据的新鲜度，旧数据会在消息中注明
+    :return: broadcast.SENT / broadcast.FAILED / broadcast.DEACTIVATED
+    """
+    started = time.perf_counter()
     try:
-        # 获取天气数据
-        weather_data, ai_suggestion = await get_city_weather(city_id)
-        if not weather_data:
-            logger.warning(f"城市 {city_name}({city_id}) 天气数据为空")
-            return
-
         # 获取用户时区
         timezone = user_data[user_id].get("timezone", DEFAULT_TIMEZONE)
         
         # 构建安全的消息内容
         safe_city_name = escape_markdown(city_name)
-        message = format_telegram_message(weather_data, ai_suggestion, safe_city_name, timezone)
+        message = format_telegram_message(weather_data, ai_suggestion, safe_city_name, timezone, freshness)
 
         # 发送消息（带重试机制）
         await retry_async(
-            bot.send_message,
-            args=(user_id, message),
+            send_limiter.send_message,
+            args=(bot, user_id, message),
             kwargs={"parse_mode": "Markdown"},
             max_retries=3,
             delay=1
         )
         logger.debug(f"用户 {user_id} 推送成功")
+        return broadcast.SENT
 
     except Forbidden as e:
         logger.warning(f"用户 {user_id} 已屏蔽机器人: {e}")
         await deactivate_user(user_id)
+        return broadcast.DEACTIVATED
     except Exception as e:
         logger.error(f"用户 {user_id} 推送失败: {str(e)}", exc_info=True)
+        return broadcast.FAILED
+    finally:
+        if timings is not None:
+            timings.record_send(time.perf_counter() - started)
 
 async def deactivate_user(user_id: str):
     """标记用户为非活跃"""
     if user_id in user_data:
         user_data[user_id]["active"] = False
-        await save_user_data()
+        await save_user_data(user_id)
         logger.info(f"已标记用户 {user_id} 为非活跃状态")
 
 async def retry_async(func, args=(), kwargs=None, max_retries=3, delay=1):
-    """带指数退避的重试机制"""
+    """带指数退避的重试机制（屏蔽、请求错误和限流不重试，限流由 send_limiter 处理）"""
     kwargs = kwargs or {}
     for attempt in range(max_retries):
         try:
             return await func(*args, **kwargs)
+        except (Forbidden, BadRequest, RetryAfter):
+            raise
         except Exception as e:
             if attempt == max_retries - 1:
                 raise
@@ -641,43 +918,44 @@ async def compare_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         city_names = city_names[:10]
     
     status_message = await update.message.reply_text(f"🔍 正在查询多个城市的天气: {', '.join(city_names)}...")
-    
-    # 存储所有选中的城市数据和天气数据
+    token = await get_qweather_token()
+    if not token:
+        await status_message.edit_text("❌ 无法生成天气API令牌，请稍后再试")
+        return
+
+    # 进度指示器（编辑频率受限）
+    progress = ["⬜️"] * len(city_names)
+    editor = ThrottledMessageEditor(status_message)
+    semaphore = asyncio.Semaphore(COMPARE_CONCURRENCY)
+
+    def show_progress():
+        editor.update(f"🔍 正在查询中...\n{''.join(progress)}")
+
+    async def resolve_city(i, city_name):
+        async with semaphore:
+            progress[i] = "🔄"
+            show_progress()
+            cities = await qweather.search_city(token, city_name)
+            progress[i] = "🔎" if cities else "❌"
+            show_progress()
+            # 自动选择第一个匹配的城市
+            return cities[0] if cities else None
+
+    # 并发解析所有城市，再一次批量获取天气，结果保持输入顺序
+    resolved = await asyncio.gather(*(resolve_city(i, name) for i, name in enumerate(city_names)))
+    weather = await get_weather_data_many(token, [city.id for city in resolved if city])
+
     selected_cities = []
     weather_data_list = []
-    token = jwt_token.generate_qweather_token()
-    
-    # 进度指示器
-    progress = ["⬜️"] * len(city_names)
-    
-    # 逐个处理每个城市
-    for i, city_name in enumerate(city_names):
-        # 更新进度
-        progress[i] = "🔄"
-        await status_message.edit_text(
-            f"🔍 正在查询中...\n{''.join(progress)}\n当前：{city_name}"
-        )
-        
-        cities = search_city(token, city_name, API_HOST)
-        if not cities:
-            progress[i] = "❌"
-            continue
-        
-        # 自动选择第一个匹配的城市
-        city_data = cities[0]
-        selected_cities.append(city_data)
-        
-        # 获取天气数据
-        weather_data, _ = await get_city_weather(city_data["id"])
+    for i, city_data in enumerate(resolved):
+        weather_data = weather.get(city_data.id) if city_data else None
         if weather_data:
+            selected_cities.append(city_data)
             weather_data_list.append(weather_data)
             progress[i] = "✅"
         else:
             progress[i] = "❌"
     
-    # 更新完成状态
-    await status_message.edit_text(f"查询完成: {''.join(progress)}")
-    
     # 如果找到了城市，显示结果
     if selected_cities and weather_data_list:
         # 构建表格数据
@@ -686,14 +964,14 @@ async def compare_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         for i, weather_data in enumerate(weather_data_list):
             if i < len(selected_cities):
                 city = selected_cities[i]
-                now = weather_data["now"]
+                now = weather_data
                 
                 row = [
-                    f"{city['name']}",
-                    f"{now['text']}",
-                    f"{now['temp']}°C",
-                    f"{now['windDir']} {now['windScale']}级",
-                    f"{now['humidity']}%"
+                    f"{city.name}",
+                    f"{now.text}",
+                    f"{fmt_number(now.temp)}°C",
+                    f"{now.wind_dir} {now.wind_scale}级",
+                    f"{fmt_number(now.humidity)}%"
                 ]
                 rows.append(row)
         
@@ -706,11 +984,13 @@ async def compare_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             table.append(f"*{row[0]}*: {row[1]}, {row[2]}, {row[3]}, 湿度{row[4]}")
         
         message += "\n".join(table)
-        message += f"\n\n🕒 观测时间: {escape_markdown(weather_data_list[0]['now']['obsTime'])}"
+        message += f"\n\n🕒 观测时间: {escape_markdown(weather_data_list[0].obs_time)}"
+        message += f"\n查询结果: {''.join(progress)}"
         
-        await update.message.reply_text(message, parse_mode="Markdown")
+        # 直接把进度消息编辑为结果，省去一次发送
+        await editor.finish(message, parse_mode="Markdown")
     else:
-        await update.message.reply_text("❌ 未能找到任何有效城市的天气数据")
+        await editor.finish(f"❌ 未能找到任何有效城市的天气数据\n{''.join(progress)}")
 
 
 async def set_timezone_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -753,7 +1033,7 @@ async def set_timezone_command(update: Update, context: ContextTypes.DEFAULT_TYP
         
         # 更新用户时区
         user_data[user_id]["timezone"] = new_timezone
-        await save_user_data()
+        await save_user_data(user_id)
         
         # 获取新时区的当前时间
         tz = pytz.timezone(new_timezone)
@@ -781,8 +1061,11 @@ async def add_warning_city_command(update: Update, context: ContextTypes.DEFAULT
         return
 
     city_name = " ".join(context.args)
-    token = jwt_token.generate_qweather_token()
-    cities = search_city(token, city_name, API_HOST)
+    token = await get_qweather_token()
+    if not token:
+        await update.message.reply_text("❌ 无法生成天气API令牌，请稍后再试")
+        return
+    cities = await qweather.search_city(token, city_name)
 
     if not cities:
         await update.message.reply_text(f"❌ 找不到城市：{escape_markdown(city_name, version=2)}")
@@ -790,21 +1073,19 @@ async def add_warning_city_command(update: Update, context: ContextTypes.DEFAULT
 
     # 使用第一个匹配结果
     selected_city_info = cities[0]
-    city_id = selected_city_info["id"]
-    full_city_name = f"{selected_city_info['name']} ({selected_city_info['adm1']})"
+    city_id = selected_city_info.id
+    full_city_name = f"{selected_city_info.name} ({selected_city_info.adm1})"
 
     if user_id not in user_data:
         # Should be created by /start, but as a safeguard
         user_data[user_id] = {
-            "warning_cities": [],
-            "notified_warnings": []
+            "active": True,
+            "warning_cities": []
         }
     
     # 初始化预警相关字段
     if "warning_cities" not in user_data[user_id]:
         user_data[user_id]["warning_cities"] = []
-    if "notified_warnings" not in user_data[user_id]:
-        user_data[user_id]["notified_warnings"] = []
 
     # 检查是否已订阅
     if any(sub["id"] == city_id for sub in user_data[user_id]["warning_cities"]):
@@ -812,9 +1093,9 @@ async def add_warning_city_command(update: Update, context: ContextTypes.DEFAULT
         return
             
     # 添加到订阅列表
-    city_to_add = {"id": city_id, "name": selected_city_info["name"], "adm1": selected_city_info['adm1']}
+    city_to_add = {"id": city_id, "name": selected_city_info.name, "adm1": selected_city_info.adm1}
     user_data[user_id]["warning_cities"].append(city_to_add)
-    await save_user_data()
+    await save_user_data(user_id)
     
     await update.message.reply_text(f"✅ 成功订阅 {escape_markdown(full_city_name, version=2)} 的天气灾害预警！", parse_mode="MarkdownV2")
     # 立即检查一次
@@ -881,7 +1162,7 @@ async def warning_callback_handler(update: Update, context: ContextTypes.DEFAULT
             if city_to_remove:
                 removed_city_name = escape_markdown(city_to_remove['name'], version=2)
                 cities.remove(city_to_remove)
-                await save_user_data()
+                await save_user_data(user_id)
                 await query.edit_message_text(text=f"已取消对 {removed_city_name} 的预警订阅。")
             else:
                 await query.edit_message_text(text="未找到该订阅，可能已被删除。")
@@ -891,9 +1172,9 @@ async def warning_callback_handler(update: Update, context: ContextTypes.DEFAULT
 
 def format_warning_message(warning, city_name):
     """格式化预警信息用于Telegram发送"""
-    title = escape_markdown(warning.get('title', '天气预警'), version=2)
-    sender = escape_markdown(warning.get('sender', '未知来源'), version=2)
-    pub_time_str = warning.get('pubTime', '')
+    title = escape_markdown(warning.title or '天气预警', version=2)
+    sender = escape_markdown(warning.sender or '未知来源', version=2)
+    pub_time_str = warning.pub_time
     if pub_time_str:
         # 格式化时间
         dt_object = datetime.fromisoformat(pub_time_str)
@@ -901,9 +1182,9 @@ def format_warning_message(warning, city_name):
     else:
         pub_time = "N/A"
 
-    text = escape_markdown(warning.get('text', '无详细信息'), version=2)
-    type_name = escape_markdown(warning.get('typeName', 'N/A'), version=2)
-    severity = escape_markdown(warning.get('severity', 'N/A'), version=2)
+    text = escape_markdown(warning.text or '无详细信息', version=2)
+    type_name = escape_markdown(warning.type_name or 'N/A', version=2)
+    severity = escape_markdown(warning.severity or 'N/A', version=2)
     city_name_escaped = escape_markdown(city_name, version=2)
 
     return (
@@ -918,104 +1199,103 @@ def format_warning_message(warning, city_name):
 
 async def check_and_send_warning_for_city(bot: Bot, user_id, city):
     """为单个用户和城市检查并发送预警"""
-    token = jwt_token.generate_qweather_token()
+    token = await get_qweather_token()
     if not token:
         logger.error("无法为预警检查生成Token")
         return
 
-    warning_data = get_weather_warning(token, city["id"])
-    if not warning_data or not warning_data.get("warning"):
+    warnings = await get_city_warnings(token, city["id"])
+    if not warnings:
         return
 
-    if user_id not in user_data or "notified_warnings" not in user_data[user_id]:
-        user_data[user_id]["notified_warnings"] = []
-
-    for warning in warning_data["warning"]:
-        warning_id = warning["id"]
-        if warning_id not in user_data[user_id]["notified_warnings"]:
-            try:
-                message = format_warning_message(warning, city["name"])
-                await bot.send_message(chat_id=user_id, text=message, parse_mode="MarkdownV2")
-                
-                user_data[user_id]["notified_warnings"].append(warning_id)
-                
-                if len(user_data[user_id]["notified_warnings"]) > 50:
-                    user_data[user_id]["notified_warnings"] = user_data[user_id]["notified_warnings"][-25:]
-                
-                await save_user_data()
-                
-            except Forbidden:
-                await deactivate_user(user_id)
-                logger.warning(f"用户 {user_id} 已屏蔽机器人，已将其停用。")
-                break
-            except Exception as e:
-                logger.error(f"发送预警消息给 {user_id} 时出错: {e}")
+    for warning in warnings:
+        warning_dedup.touch(warning.id, warning.end_time)
+        if warning_dedup.contains(warning.id, user_id):
+            continue
+        message = format_warning_message(warning, city["name"])
+        delivered = await deliver_warning(bot, user_id, warning, message)
+        if not delivered and not user_data.get(user_id, {}).get("active", True):
+            break
+
+async def deliver_warning(bot: Bot, user_id, warning, message):
+    """
+    发送一条已渲染的预警给单个用户并记录到去重存储
+    :return: 是否发送成功
+    """
+    data = user_data.get(user_id)
+    # 与 SubscriptionIndex 一致：没有 active 字段视为已开启
+    if not data or not data.get("active", True):
+        return False
+    try:
+        await send_limiter.send_message(bot, user_id, message, parse_mode="MarkdownV2")
+    except Forbidden:
+        await deactivate_user(user_id)
+        logger.warning(f"用户 {user_id} 已屏蔽机器人，已将其停用。")
+        return False
+    except Exception as e:
+        logger.error(f"分发预警给 {user_id} 时出错: {e}")
+        return False
+    warning_dedup.add(warning.id, user_id, warning.end_time)
+    return True
 
 async def check_weather_warnings(context: CallbackContext):
-    """后台定时任务：检查所有用户的预警订阅"""
-    logger.info("后台任务：开始检查天气灾害预警...")
-    all_cities_to_check = {}
-    for user_id, data in user_data.items():
-        if data.get("active") and data.get("warning_cities"):
-            for city in data["warning_cities"]:
-                if city["id"] not in all_cities_to_check:
-                    all_cities_to_check[city["id"]] = city
-    
+    """后台定时任务：检查到期城市的预警（每个城市的间隔由自适应轮询计划决定）"""
+    logger.debug("后台任务：开始检查天气灾害预警...")
+    all_cities_to_check = subscription_index.cities()
     if not all_cities_to_check:
-        logger.info("后台任务：没有需要检查的预警城市。")
+        logger.debug("后台任务：没有需要检查的预警城市。")
         return
 
-    token = jwt_token.generate_qweather_token()
-    if not token:
-        logger.error("无法为后台预警任务生成Token")
-        return
-
-    all_warnings_found = {} # {city_id: [warnings]}
-    for city_id, city_info in all_cities_to_check.items():
-        try:
-            warning_data = get_weather_warning(token, city_id)
-            if warning_data and warning_data.get("warning"):
-                all_warnings_found[city_id] = warning_data["warning"]
-            await asyncio.sleep(1)
-        except Exception as e:
-            logger.error(f"检查城市 {city_info['name']} ({city_id}) 预警时出错: {e}")
+    # 每个城市的查询由 poll_city_warnings 自行获取Token（Token已缓存）
+    all_warnings_found = await warning_poller.poll(all_cities_to_check)  # {city_id: [warnings]}
+    logger.info(f"预警轮询统计: {warning_poller.stats()}")
 
     if not all_warnings_found:
         return
-        
-    for user_id, data in user_data.items():
-        if not data.get("active") or not data.get("warning_cities"):
-            continue
 
-        if "notified_warnings" not in data:
-            data["notified_warnings"] = []
-            
-        for subscribed_city in data["warning_cities"]:
-            city_id = subscribed_city["id"]
-            if city_id in all_warnings_found:
-                for warning in all_warnings_found[city_id]:
-                    if warning["id"] not in data["notified_warnings"]:
-                        try:
-                            message = format_warning_message(warning, subscribed_city["name"])
-                            await context.bot.send_message(chat_id=user_id, text=message, parse_mode="MarkdownV2")
-                            data["notified_warnings"].append(warning["id"])
-                            if len(data["notified_warnings"]) > 50:
-                                data["notified_warnings"] = data["notified_warnings"][-25:]
-                        except Forbidden:
-                            await deactivate_user(user_id)
-                            logger.warning(f"用户 {user_id} 已屏蔽机器人，已将其停用。")
-                            break
-                        except Exception as e:
-                            logger.error(f"分发预警给 {user_id} 时出错: {e}")
-                if not data.get("active"): # Check again in case user was deactivated
-                    break
-            
-    await save_user_data()
-    logger.info("后台任务：天气灾害预警检查完成。")
+    # 仍在生效的预警续期发送记录，避免记录先于预警过期而重复发送
+    for warnings in all_warnings_found.values():
+        for warning in warnings:
+            warning_dedup.touch(warning.id, warning.end_time)
+
+    def items():
+        # 每条预警只渲染一次；同一预警可能出现在用户订阅的多个城市中，每个用户只发送一次
+        seen = set()
+        for city_id, warnings in all_warnings_found.items():
+            subscribers = subscription_index.subscribers(city_id)
+            city_name = all_cities_to_check[city_id]["name"]
+            for warning in warnings:
+                recipients = [
+                    user_id for user_id in subscribers
+                    if (warning.id, user_id) not in seen and not warning_dedup.contains(warning.id, user_id)
+                ]
+                if not recipients:
+                    continue
+                message = format_warning_message(warning, city_name)
+                for user_id in recipients:
+                    seen.add((warning.id, user_id))
+                    yield user_id, warning, message
+
+    async def deliver(item):
+        user_id, warning, message = item
+        if await deliver_warning(context.bot, user_id, warning, message):
+            return broadcast.SENT
+        return broadcast.FAILED if (user_data.get(user_id) or {}).get("active", True) else broadcast.DEACTIVATED
+
+    global current_warning_broadcast
+    current_warning_broadcast = BroadcastEngine(deliver, name="预警推送")
+    try:
+        progress = await current_warning_broadcast.run(items())
+    finally:
+        current_warning_broadcast = None
+    logger.info(f"后台任务：天气灾害预警检查完成，发送 {progress['sent']}/{progress['queued']} 条: {progress}")
 
 async def post_init(app: Application):
-    """在机器人启动后加载用户数据并设置命令列表"""
+    """在机器人启动后加载用户数据、创建AI客户端并设置命令列表"""
+    global ai_client
     await load_user_data()
+    ai_client = GrokClient(XAI_API_KEY, system_prompt=AI_SYSTEM_PROMPT)
+    await ai_client.start()
     await app.bot.set_my_commands([
         ("help", "显示帮助"),
         ("weather", "查询天气"),
@@ -1030,7 +1310,25 @@ async def post_init(app: Application):
 async def post_stop(app: Application):
     """在机器人停止前保存用户数据"""
     logger.info("机器人正在关闭...")
-    await save_user_data()
+    if current_broadcast is not None:
+        current_broadcast.cancel()
+    if current_warning_broadcast is not None:
+        current_warning_broadcast.cancel()
+    for task in list(weather_refreshes.values()):
+        task.cancel()
+    await flush_user_data()
+    logger.info(f"用户数据写入统计: {user_store.stats()}")
+    logger.info(f"Telegram 限流统计: {send_limiter.stats()}")
+    logger.info(f"预警轮询统计: {warning_poller.stats()}, 预警发送记录: {warning_dedup.stats()}")
+    logger.info(f"天气查询合并统计: {weather_flight.stats()}, AI请求合并统计: {ai_flight.stats()}")
+    log_cache_stats()
+    if qweather.city_cache:
+        logger.info(f"城市搜索缓存统计: {qweather.city_cache.stats()}")
+    await qweather.close()
+    if ai_client is not None:
+        await ai_client.close()
+    token_provider.close()
+    await user_store.close()
 
 async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
     """记录更新引起的错误"""
@@ -1076,12 +1374,16 @@ def main():
 
     # 定时任务
     job_queue = app.job_queue
-    job_queue.run_daily(
+    job_queue.run_repeating(
         send_scheduled_weather,
-        time=datetime.strptime("00:00", "%H:%M").time(),
-        name="daily_weather_check",
+        interval=60,
+        first=60 - datetime.now().second,  # 对齐到下一个整分钟
+        name="reminder_tick",
+    )
+    job_queue.run_repeating(check_weather_warnings, interval=WARNING_POLL_TICK, first=10, name="warning_check")
+    job_queue.run_repeating(
+        flush_user_data, interval=USER_DATA_FLUSH_INTERVAL, first=USER_DATA_FLUSH_INTERVAL, name="user_data_flush"
     )
-    job_queue.run_repeating(check_weather_warnings, interval=1800, first=10, name="warning_check")
 
 
     # 启动机器人